@@ -0,0 +1,91 @@
+"""PDT API response cache."""
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ResponseCache(object):
+
+    """Cache of the serialized API responses with the hit ratio metrics.
+
+    Responses are keyed by the entity tag of the request, which covers the normalized query string and the data
+    versions of the models the response is built from. The model change bumps its version, so the cached responses
+    built from it are not read anymore and expire. Hits and misses are counted in the cache per resource, so the
+    metrics are shared by all the processes.
+    """
+
+    key_prefix = 'pdt:api-response:'
+    counter_prefix = 'pdt:api-response-counter:'
+    counter_names = ('hits', 'misses')
+
+    def __init__(self, timeout=None):
+        """Initialize new instance."""
+        self.timeout = timeout or settings.API_RESPONSE_CACHE_TIMEOUT
+
+    def get_counter_key(self, resource, name):
+        """Get the cache key of the resource counter."""
+        return '{0}{1}:{2}'.format(self.counter_prefix, resource, name)
+
+    def count(self, resource, name):
+        """Increment the resource counter."""
+        key = self.get_counter_key(resource, name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key)
+
+    def get(self, resource, etag):
+        """Get the cached response data.
+
+        :param resource: resource name
+        :type resource: str
+        :param etag: entity tag of the request
+        :type etag: str
+
+        :return: response data or None if it's not cached
+        """
+        data = cache.get(self.key_prefix + etag)
+        self.count(resource, 'misses' if data is None else 'hits')
+        return data
+
+    def set(self, etag, data):
+        """Cache the response data.
+
+        :param etag: entity tag of the request
+        :type etag: str
+        :param data: response data
+        """
+        cache.set(self.key_prefix + etag, data, self.timeout)
+
+    def stats(self, resources):
+        """Get the hit ratio metrics.
+
+        :param resources: resource names
+        :type resources: list
+
+        :return: hits, misses and the hit ratio per resource
+        :rtype: dict
+        """
+        keys = {
+            (resource, name): self.get_counter_key(resource, name)
+            for resource in resources for name in self.counter_names}
+        values = cache.get_many(keys.values())
+        stats = {}
+        for resource in resources:
+            counters = {name: values.get(keys[resource, name], 0) for name in self.counter_names}
+            total = counters['hits'] + counters['misses']
+            counters['ratio'] = round(counters['hits'] / total, 3) if total else 0
+            stats[resource] = counters
+        return stats
+
+    def reset_stats(self, resources):
+        """Reset the hit ratio metrics.
+
+        :param resources: resource names
+        :type resources: list
+        """
+        cache.delete_many([
+            self.get_counter_key(resource, name) for resource in resources for name in self.counter_names])
+
+
+response_cache = ResponseCache()
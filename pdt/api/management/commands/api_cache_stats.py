@@ -0,0 +1,25 @@
+"""Report the API response cache hit ratio."""
+from django.core.management.base import BaseCommand
+
+from pdt.api.caching import response_cache
+from pdt.api.urls import router
+
+
+class Command(BaseCommand):
+
+    """Report the hits, misses and the hit ratio of the cached API resources."""
+
+    help = 'Report the hits, misses and the hit ratio of the cached API resources.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--reset', action='store_true', default=False, help='Reset the counters after reporting them.')
+
+    def handle(self, *args, **options):
+        """Report the metrics of all the cached resources."""
+        resources = [viewset.cache_name for _, viewset, _ in router.registry if getattr(viewset, 'cache_name', None)]
+        for resource, stats in sorted(response_cache.stats(resources).items()):
+            self.stdout.write('{0}: {hits} hits, {misses} misses, {ratio:.1%} hit ratio'.format(resource, **stats))
+        if options['reset']:
+            response_cache.reset_stats(resources)
@@ -0,0 +1,206 @@
+"""PDT API pagination."""
+import base64
+import collections
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import ForeignKey, Q
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_value(value):
+    """Encode the position value to be serialized to json without losing the precision."""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(BasePagination):  # pylint: disable=W0223
+
+    """Cursor pagination by the composite key of the queryset ordering.
+
+    The cursor is the position of the last item of the page: the values of all the ordering fields, the primary
+    key is added to the ordering to make it unique. The following page is selected by comparing the ordering
+    fields with the position, so that it's the index range scan instead of the offset.
+
+    Pagination is enabled by **`page_size`** query string parameter, the following page is requested by
+    **`cursor`** query string parameter of the **`next`** link.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = _('Invalid cursor')
+
+    page_size = None
+    request = None
+    ordering = None
+    next_position = None
+
+    def get_page_size(self, request):
+        """Get the requested page size.
+
+        :return: page size or None if the pagination is not requested
+        """
+        if self.page_size_query_param not in request.query_params:
+            return None
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size <= 0:
+                raise ValueError(page_size)
+        except ValueError:
+            raise ValidationError('Page size should be a positive integer')
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        """Decode the cursor position.
+
+        :return: position or None if the cursor is not given
+        :rtype: list
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        """Encode the cursor position."""
+        return base64.urlsafe_b64encode(
+            json.dumps([encode_value(value) for value in position]).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def get_ordering(queryset):
+        """Get the queryset ordering with the primary key to make it unique.
+
+        Foreign keys are ordered by their column instead of the related model ordering, so that the keyset
+        comparison matches the sort order.
+        """
+        opts = queryset.model._meta  # pylint: disable=W0212
+        ordering = []
+        for field in queryset.query.order_by or opts.ordering:
+            name = field.lstrip('-')
+            try:
+                model_field = opts.get_field(name)
+            except FieldDoesNotExist:
+                model_field = None
+            if isinstance(model_field, ForeignKey):
+                field = field[:len(field) - len(name)] + model_field.attname
+            ordering.append(field)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return ordering
+
+    def get_position(self, instance):
+        """Get the position of the instance: values of the ordering fields."""
+        position = []
+        for field in self.ordering:
+            names = field.lstrip('-').split('__')
+            obj = instance
+            for name in names[:-1]:
+                obj = getattr(obj, name) if obj is not None else None
+            if obj is None:
+                position.append(None)
+            elif names[-1] == 'pk':
+                position.append(obj.pk)
+            else:
+                position.append(getattr(obj, obj._meta.get_field(names[-1]).attname))  # pylint: disable=W0212
+        return position
+
+    def get_position_filter(self, position, nulls_largest=False):
+        """Get the filter of the items following the position.
+
+        For the ordering (a, b) it's ``a > x or (a = x and b > y)``. Null values are compared the way the database
+        sorts them.
+
+        :param position: values of the ordering fields
+        :type position: list
+        :param nulls_largest: the database sorts the null values after the rest in the ascending order
+        :type nulls_largest: bool
+        """
+        result = None
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            nulls_last = nulls_largest != field.startswith('-')
+            if value is None:
+                following = None if nulls_last else equal & Q(**{name + '__isnull': False})
+                equal &= Q(**{name + '__isnull': True})
+            else:
+                following = Q(**{name + ('__lt' if field.startswith('-') else '__gt'): value})
+                if nulls_last:
+                    following |= Q(**{name + '__isnull': True})
+                following = equal & following
+                equal &= Q(**{name: value})
+            if following is not None:
+                result = following if result is None else result | following
+        return result if result is not None else Q(pk__in=[])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Get the page of the queryset following the cursor position."""
+        self.page_size = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            if len(position) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self.get_position_filter(
+                position, nulls_largest=connections[queryset.db].features.nulls_order_largest))
+        results = list(queryset[:self.page_size + 1])
+        page = results[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if len(results) > self.page_size else None
+        return page
+
+    def paginate_keys(self, keys, request):
+        """Get the page of the sorted list of the unique keys following the cursor position.
+
+        :param keys: sorted list of the unique keys
+        :type keys: list
+
+        :return: keys of the page or None if the pagination is not requested
+        :rtype: list
+        """
+        self.page_size = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+        self.request = request
+        position = self.decode_cursor(request)
+        start = 0
+        if position is not None:
+            try:
+                start = keys.index(position[0]) + 1
+            except (IndexError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        page = keys[start:start + self.page_size]
+        self.next_position = [page[-1]] if start + self.page_size < len(keys) else None
+        return page
+
+    def get_next_link(self):
+        """Get the link to the following page."""
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        """Get the response with the link to the following page."""
+        return Response(collections.OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
@@ -1,8 +1,11 @@
 """PDT API serializers."""
+import collections
+from itertools import chain
 import logging
 
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
 
 from rest_framework import serializers
 
@@ -16,10 +19,13 @@ from pdt.core.models import (
     MigrationReport,
     MigrationStep,
     MigrationStepReport,
+    MigrationStepReportLogChunk,
     PostDeployMigrationStep,
     PreDeployMigrationStep,
     Release,
+    touch_model_versions,
 )
+from pdt.core.tasks import attach_deployment_report_cases
 
 logger = logging.getLogger(__name__)
 
@@ -118,27 +124,12 @@ class CIProjectSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('id', 'name', 'description')
 
 
-class MigrationStepListSerializer(serializers.ListSerializer):  # pylint: disable=W0223
-
-    """List serializer which filters out applied steps."""
-
-    def to_representation(self, data):
-        """Filter out applied steps."""
-        exclude_status = self.context['request'].REQUEST.get('exclude_status')
-        if exclude_status:
-            data = data.filter(
-                ~Q(reports__status=exclude_status)
-            )
-        return super(MigrationStepListSerializer, self).to_representation(data)
-
-
 class MigrationStepSerializer(serializers.HyperlinkedModelSerializer):
 
     """Migration step serializer."""
 
     class Meta:
         fields = ('id', 'position', 'type', 'code', 'path')
-        list_serializer_class = MigrationStepListSerializer
 
 
 class PreDeployMigrationStepSerializer(MigrationStepSerializer):
@@ -242,6 +233,8 @@ class MigrationSerializer(CaseFieldMixin):
 
     class MigrationReportSerializer(InstanceFieldMixin):
 
+        log = serializers.CharField(source='get_log', read_only=True)
+
         class Meta:
             model = MigrationReport
             fields = ('id', 'instance', 'status', 'datetime', 'log')
@@ -253,6 +246,8 @@ class MigrationSerializer(CaseFieldMixin):
     parent = serializers.CharField(source='parent.uid', allow_null=True)
     release = ReleaseSerializer(source='case.release', read_only=True)
 
+    changed = True
+
     class Meta:
         model = Migration
         fields = (
@@ -275,35 +270,73 @@ class MigrationSerializer(CaseFieldMixin):
                 raise serializers.ValidationError(message)
         return value
 
+    def update_steps(self, migration, steps, created):
+        """Update the migration steps, only writing the changed ones.
+
+        Steps are matched by the phase and the digest of their content, the unchanged steps are kept together
+        with their reports, the stale ones are deleted and the new ones are bulk created.
+
+        :param migration: migration object
+        :param steps: validated steps data with the phases and the positions
+        :type steps: list
+        :param created: the migration is just created and has no steps
+        :type created: bool
+
+        :return: True if the steps were changed
+        :rtype: bool
+        """
+        existing = collections.defaultdict(list)
+        if not created:
+            for values in migration.steps.values('id', 'phase', *MigrationStep.DIGEST_FIELDS):
+                existing[values['phase'], MigrationStep.get_digest(values)].append(values['id'])
+        new_steps = []
+        for step in steps:
+            step_ids = existing.get((step['phase'], MigrationStep.get_digest(step)))
+            if step_ids:
+                step_ids.pop()
+            else:
+                new_steps.append(MigrationStep(migration=migration, **step))
+        stale_ids = [step_id for step_ids in existing.values() for step_id in step_ids]
+        if stale_ids:
+            MigrationStep.objects.filter(id__in=stale_ids).delete()
+        if new_steps:
+            MigrationStep.objects.bulk_create(new_steps)
+            # bulk create does not send the signals which change the data versions
+            touch_model_versions(Migration, MigrationStep)
+        return bool(stale_ids or new_steps)
+
+    @transaction.atomic
     def create(self, validated_data):
-        """Create or update the instance due to unique key on case."""
-        pre_deploy_steps = validated_data.pop('pre_deploy_steps')
-        post_deploy_steps = validated_data.pop('post_deploy_steps')
-        final_steps = validated_data.pop('final_steps')
-        parent = validated_data.pop('parent')['uid']
+        """Create or update the instance due to unique key on case.
+
+        If the content digest matches the stored one, nothing is written. Otherwise only the changed steps are
+        written and the migration is only saved if it's changed.
+        """
+        phases = [
+            [dict(step_data, phase=phase, position=index) for index, step_data in enumerate(validated_data.pop(name))]
+            for name, phase in MigrationStep.PHASE_ACCESSORS]
+        parent = validated_data.pop('parent')['uid'] or None
+        digest = Migration.get_digest(
+            validated_data['uid'], parent.uid if parent else None, validated_data['case'].id, phases)
         try:
-            instance = Migration.objects.get(
-                case=validated_data['case'])
-            migration = self.update(instance, validated_data)
-            migration.pre_deploy_steps.get_queryset().delete()
-            migration.post_deploy_steps.get_queryset().delete()
-            migration.final_steps.get_queryset().delete()
+            migration = Migration.objects.get(case=validated_data['case'])
+            created = False
         except Migration.DoesNotExist:
-            migration = super(MigrationSerializer, self).create(validated_data)
-        migration.parent = parent
-        migration.save()
-        pre_deploy_steps = [
-            PreDeployMigrationStep.objects.create(**dict(step_data, migration=migration, position=index))
-            for index, step_data in enumerate(pre_deploy_steps)
-        ]
-        post_deploy_steps = [
-            PostDeployMigrationStep.objects.create(**dict(step_data, migration=migration, position=index))
-            for index, step_data in enumerate(post_deploy_steps)
-        ]
-        final_steps = [
-            FinalMigrationStep.objects.create(**dict(step_data, migration=migration, position=index))
-            for index, step_data in enumerate(final_steps)
-        ]
+            migration = Migration(**validated_data)
+            created = True
+        self.changed = created or migration.digest != digest
+        if not self.changed:
+            return migration
+        values = dict(validated_data, parent=parent)
+        if created or any(getattr(migration, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(migration, name, value)
+            migration.save()
+        self.update_steps(migration, list(chain.from_iterable(phases)), created)
+        # the digest update should not reset the digest via the migration signals
+        Migration.objects.filter(id=migration.id).update(digest=digest)
+        touch_model_versions(Migration)
+        migration.digest = digest
         return migration
 
 
@@ -323,6 +356,7 @@ class MigrationReportSerializer(InstanceFieldMixin):
             }
 
     migration = MigrationSerializer()
+    log = serializers.CharField(source='get_log', read_only=True)
 
     class Meta:
         model = MigrationReport
@@ -330,12 +364,39 @@ class MigrationReportSerializer(InstanceFieldMixin):
         validators = []
         extra_kwargs = {
             'datetime': {'default': lambda: timezone.localtime(timezone.now())},
-            'log': {'read_only': True},
             'status': {'read_only': True}
         }
 
 
-class MigrationStepReportSerializer(serializers.HyperlinkedModelSerializer):
+class LogField(serializers.CharField):
+
+    """Report log field which includes the appended log chunks."""
+
+    def get_attribute(self, instance):
+        """Get the whole report log."""
+        return instance.get_log()
+
+
+class LogChunkSerializer(serializers.Serializer):  # pylint: disable=W0223
+
+    """Report log chunk serializer."""
+
+    offset = serializers.IntegerField(min_value=0)
+    log = serializers.CharField(trim_whitespace=False)
+
+
+class ChunkedLogFieldMixin(object):
+
+    """Drop the appended log chunks of the report when its whole log is replaced."""
+
+    def update(self, instance, validated_data):
+        """Update the report, dropping the stale log chunks."""
+        if 'log' in validated_data:
+            instance.log_chunks.all().delete()
+        return super(ChunkedLogFieldMixin, self).update(instance, validated_data)
+
+
+class MigrationStepReportSerializer(ChunkedLogFieldMixin, serializers.HyperlinkedModelSerializer):
 
     """Migration step report serializer."""
 
@@ -381,6 +442,7 @@ class MigrationStepReportSerializer(serializers.HyperlinkedModelSerializer):
             }
 
     step = MigrationStepSerializer()
+    log = LogField(required=False, allow_blank=True)
 
     class Meta:
         model = MigrationStepReport
@@ -423,6 +485,63 @@ class MigrationStepReportSerializer(serializers.HyperlinkedModelSerializer):
             return super(MigrationStepReportSerializer, self).create(validated_data)
 
 
+class MigrationStepReportBulkSerializer(serializers.Serializer):  # pylint: disable=W0223
+
+    """Migration step reports bulk serializer.
+
+    Accepts all the step reports of the migration application on the instance at once.
+    """
+
+    class StepReportSerializer(serializers.ModelSerializer):
+
+        step = MigrationStepReportSerializer.MigrationStepSerializer()
+
+        class Meta:
+            model = MigrationStepReport
+            fields = ('step', 'status', 'datetime', 'log')
+            validators = []
+            extra_kwargs = {
+                'datetime': {'default': lambda: timezone.localtime(timezone.now())},
+            }
+
+    report = MigrationStepReportSerializer.MigrationReportSerializer()
+    step_reports = StepReportSerializer(many=True)
+
+    def validate(self, data):
+        """Validate that the steps belong to the migration."""
+        step_ids = frozenset(step.id for step in data['report']['migration'].get_steps())
+        unknown = [
+            step_report['step']['id'] for step_report in data['step_reports']
+            if step_report['step']['id'] not in step_ids]
+        if unknown:
+            raise serializers.ValidationError(
+                {'step_reports': ['Migration steps {0} do not belong to the migration'.format(unknown)]})
+        return data
+
+    def create(self, validated_data):
+        """Create or update the step reports and calculate the migration report once."""
+        step_reports = collections.OrderedDict(
+            (step_report['step']['id'], step_report) for step_report in validated_data['step_reports'])
+        with transaction.atomic():
+            report, _ = MigrationReport.objects.get_or_create(
+                migration=validated_data['report']['migration'], instance=validated_data['report']['instance'])
+            existing = dict(report.step_reports.filter(step__in=step_reports.keys()).values_list('step', 'id'))
+            new_step_reports = []
+            for step_id, step_report in step_reports.items():
+                values = dict(
+                    status=step_report['status'], datetime=step_report['datetime'], log=step_report.get('log', ''))
+                if step_id in existing:
+                    MigrationStepReport.objects.filter(id=existing[step_id]).update(**values)
+                else:
+                    new_step_reports.append(MigrationStepReport(report=report, step_id=step_id, **values))
+            MigrationStepReport.objects.bulk_create(new_step_reports)
+            # the logs of the existing step reports are replaced, so their appended chunks are stale
+            MigrationStepReportLogChunk.objects.filter(report__in=existing.values()).delete()
+            report.calculate()
+        return list(report.step_reports.filter(step__in=step_reports.keys()).select_related(
+            'report__migration', 'report__instance', 'step').prefetch_related('log_chunks'))
+
+
 class ReleaseFieldMixin(serializers.HyperlinkedModelSerializer):
 
     """Add custom release field handling."""
@@ -452,7 +571,8 @@ class ReleaseFieldMixin(serializers.HyperlinkedModelSerializer):
         return value
 
 
-class DeploymentReportSerializer(ReleaseFieldMixin, InstanceFieldMixin, serializers.HyperlinkedModelSerializer):
+class DeploymentReportSerializer(
+        ChunkedLogFieldMixin, ReleaseFieldMixin, InstanceFieldMixin, serializers.HyperlinkedModelSerializer):
 
     """Deployment report serializer."""
 
@@ -470,20 +590,32 @@ class DeploymentReportSerializer(ReleaseFieldMixin, InstanceFieldMixin, serializ
             }
 
     cases = CaseSerializer(many=True, write_only=True)
+    log = LogField(required=False, allow_blank=True)
+    not_found_cases = serializers.SerializerMethodField()
 
     class Meta:
         model = DeploymentReport
-        fields = ('id', 'instance', 'status', 'datetime', 'log', 'cases')
+        fields = ('id', 'instance', 'status', 'datetime', 'log', 'cases', 'not_found_cases')
+
+    def get_not_found_cases(self, obj):
+        """Get the ids of the report cases which were not found in Fogbugz."""
+        return getattr(obj, 'not_found_cases', [])
 
     def create(self, validated_data):
-        """Create or update the instance due to unique key on case."""
-        cases = validated_data.pop('cases')
+        """Create the report, resolving the cases at once.
+
+        Known cases are attached right away, unknown ones are fetched from Fogbugz with a single search, and the
+        deployment notifications are sent for them. If there are too many unknown cases or Fogbugz is not
+        available, they are attached and notified asynchronously. Case ids which are not found in Fogbugz are
+        skipped and returned in the not_found_cases field.
+        """
+        case_ids = frozenset(case_data['id'] for case_data in validated_data.pop('cases'))
         report = super(DeploymentReportSerializer, self).create(validated_data)
-        report.cases.clear()
-        report_cases = []
-        for case_data in cases:
-            case, _ = Case.objects.get_or_create_from_fogbugz(case_data['id'])
-            report_cases.append(case)
+        report_cases, missing = Case.objects.get_or_create_many_from_fogbugz(
+            case_ids, fetch_limit=settings.DEPLOYMENT_REPORT_CASES_FETCH_LIMIT)
         report.cases = report_cases
         report.save()
+        report.not_found_cases = sorted(case_ids.difference(case.id for case in report_cases).difference(missing))
+        if missing:
+            attach_deployment_report_cases.apply_async(kwargs=dict(report_id=report.id, case_ids=sorted(missing)))
         return report
@@ -1,14 +1,31 @@
 """PDT API views."""
+from calendar import timegm
+import collections
+import functools
+import hashlib
+import json
 import logging
 
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag,
+)
 
 import django_filters
 from rest_framework import (
     exceptions,
+    status,
     viewsets,
 )
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import (
+    detail_route,
+    list_route,
+)
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
@@ -17,20 +34,28 @@ from pdt.core.models import (
     CIProject,
     DeploymentReport,
     Instance,
+    LogOffsetError,
     Migration,
     MigrationReport,
+    MigrationSortError,
+    MigrationStep,
     MigrationStepReport,
+    MigrationStepReportLogChunk,
     Release,
+    get_model_versions,
 )
 from pdt.core.tasks import update_case_from_fogbugz
 
+from .caching import response_cache
 from .serializers import (
     CaseSerializer,
     CIProjectSerializer,
     DeploymentReportSerializer,
     InstanceSerializer,
+    LogChunkSerializer,
     MigrationReportSerializer,
     MigrationSerializer,
+    MigrationStepReportBulkSerializer,
     MigrationStepReportSerializer,
     ReleaseSerializer,
 )
@@ -38,7 +63,196 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 
-class InstanceViewSet(viewsets.ModelViewSet):
+def get_etag(request, versions):
+    """Get the entity tag of the resource representation.
+
+    The query string is normalized, so the order of the parameters does not matter.
+
+    :param request: API request
+    :param versions: data versions of the resource models
+    :type versions: list
+
+    :return: entity tag
+    :rtype: str
+    """
+    value = json.dumps([
+        request.build_absolute_uri(request.path),
+        sorted((name, sorted(values)) for name, values in request.query_params.lists()),
+        request.accepted_renderer.format, [version.isoformat() for version in versions]])
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def is_not_modified(request, etag, last_modified):
+    """Check if the client has the current resource representation.
+
+    The entity tag takes precedence over the modification date if both are given.
+
+    :param request: API request
+    :param etag: entity tag
+    :type etag: str
+    :param last_modified: modification timestamp
+    :type last_modified: int
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def conditional(func):
+    """Answer the unchanged resource with 304 before it's queried and serialized.
+
+    ETag and Last-Modified of the response are derived from the data versions of the view ``version_models``.
+    """
+    @functools.wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        """Call the view unless the resource is not modified."""
+        versions = self.get_versions()
+        etag = get_etag(request, versions)
+        last_modified = timegm(max(versions).utctimetuple())
+        if is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = func(self, request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = quote_etag(etag)
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    return wrapper
+
+
+def cached(func):
+    """Serve the response data from the cache if the view has the ``cache_name``.
+
+    Only successful responses are cached, under the entity tag of the request.
+    """
+    @functools.wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        """Call the view unless its response is cached."""
+        if self.cache_name is None:
+            return func(self, request, *args, **kwargs)
+        etag = get_etag(request, self.get_versions())
+        data = response_cache.get(self.cache_name, etag)
+        if data is not None:
+            return Response(data)
+        response = func(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(etag, response.data)
+        return response
+    return wrapper
+
+
+class ConditionalMixin(object):
+
+    """Conditional GET of the list and the details by the data versions of the models the resource is built from.
+
+    Unchanged resource is answered with 304 to the requests with **`If-None-Match`** or **`If-Modified-Since`**
+    header. The list is served from the response cache if the ``cache_name`` is set.
+    """
+
+    version_models = ()
+    versions = None
+    cache_name = None
+
+    def get_versions(self):
+        """Get the data versions of the view models once per request."""
+        if self.versions is None:
+            self.versions = get_model_versions(*self.version_models)
+        return self.versions
+
+    @conditional
+    @cached
+    def list(self, request, *args, **kwargs):
+        """List the resources unless they are not modified."""
+        return super(ConditionalMixin, self).list(request, *args, **kwargs)
+
+    @conditional
+    def retrieve(self, request, *args, **kwargs):
+        """Get the resource unless it's not modified."""
+        return super(ConditionalMixin, self).retrieve(request, *args, **kwargs)
+
+
+class LogChunksMixin(object):
+
+    """Append-only report log uploaded and read in chunks."""
+
+    @detail_route(methods=['get', 'post'])
+    def log(self, request, pk=None):
+        """Append the log chunk or get the log range.
+
+        The chunk is posted as `{"offset": ..., "log": ...}`, where the offset is the current log length.
+        The log range is requested via **`offset`** and **`limit`** query string parameters.
+        """
+        report = self.get_object()
+        if request.method == 'POST':
+            serializer = LogChunkSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                length = report.append_log(**serializer.validated_data)
+            except LogOffsetError as e:
+                return Response(dict(detail=str(e), length=e.length), status=status.HTTP_409_CONFLICT)
+            return Response(dict(offset=serializer.validated_data['offset'], length=length))
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+        except ValueError:
+            raise exceptions.ValidationError('Offset and limit should be integers')
+        if offset < 0 or (limit is not None and limit < 0):
+            raise exceptions.ValidationError('Offset and limit should not be negative')
+        return Response(dict(
+            offset=offset, length=report.get_log_length(), log=report.get_log(offset, limit)))
+
+
+class DeferredLogMixin(object):
+
+    """Do not load the report logs in the list unless they are requested.
+
+    The list fields are limited via **`fields`** query string parameter, the log is included via
+    **`include=log`** query string parameter or by listing it in the fields.
+    """
+
+    log_related = ()
+
+    def get_list_fields(self):
+        """Get the requested list fields.
+
+        :return: field names or None if all the fields are requested
+        """
+        if self.action != 'list':
+            return None
+        fields = self.request.query_params.get('fields')
+        include = self.request.query_params.get('include', '').split(',')
+        if fields:
+            fields = frozenset(fields.split(','))
+        elif 'log' in include:
+            return None
+        else:
+            fields = frozenset(self.get_serializer_class()().fields).difference(('log',))
+        return fields.union(('log',)) if 'log' in include else fields
+
+    def get_queryset(self):
+        """Defer the log columns if the log is not requested."""
+        queryset = super(DeferredLogMixin, self).get_queryset()
+        fields = self.get_list_fields()
+        if fields is not None and 'log' not in fields:
+            return queryset.defer('log')
+        return queryset.prefetch_related(*self.log_related)
+
+    def get_serializer(self, *args, **kwargs):
+        """Limit the serialized fields to the requested ones."""
+        serializer = super(DeferredLogMixin, self).get_serializer(*args, **kwargs)
+        fields = self.get_list_fields()
+        if fields is not None:
+            child = getattr(serializer, 'child', serializer)
+            for name in list(child.fields):
+                if name not in fields:
+                    child.fields.pop(name)
+        return serializer
+
+
+class InstanceViewSet(ConditionalMixin, viewsets.ModelViewSet):
 
     """Return a list of all instances in the system.
 
@@ -49,16 +263,21 @@ class InstanceViewSet(viewsets.ModelViewSet):
     Orderings (via **`order_by`** query string parameter):
 
     * name
+
+    Unchanged resource is answered with 304 to the conditional GET via **`If-None-Match`** or
+    **`If-Modified-Since`** header.
     """
 
     queryset = Instance.objects.all()
     serializer_class = InstanceSerializer
+    cache_name = 'instances'
+    version_models = (Instance, CIProject, Instance.ci_projects.through)
     filter_fields = ('name',)
     ordering_fields = ('name',)
     ordering = ('name',)
 
 
-class ReleaseViewSet(viewsets.ModelViewSet):
+class ReleaseViewSet(ConditionalMixin, viewsets.ModelViewSet):
 
     """Return a list of all releases in the system.
 
@@ -71,16 +290,20 @@ class ReleaseViewSet(viewsets.ModelViewSet):
 
     * number
     * datetime
+
+    Unchanged resource is answered with 304 to the conditional GET via **`If-None-Match`** or
+    **`If-Modified-Since`** header.
     """
 
     queryset = Release.objects.all()
     serializer_class = ReleaseSerializer
+    version_models = (Release,)
     filter_fields = ('number', 'datetime')
     ordering_fields = ('number', 'datetime')
     ordering = ('number',)
 
 
-class CIProjectViewSet(viewsets.ModelViewSet):
+class CIProjectViewSet(ConditionalMixin, viewsets.ModelViewSet):
 
     """Return a list of all continuous integration projects in the system.
 
@@ -91,10 +314,14 @@ class CIProjectViewSet(viewsets.ModelViewSet):
     Orderings (via **`order_by`** query string parameter):
 
     * name
+
+    Unchanged resource is answered with 304 to the conditional GET via **`If-None-Match`** or
+    **`If-Modified-Since`** header.
     """
 
     queryset = CIProject.objects.all()
     serializer_class = CIProjectSerializer
+    version_models = (CIProject,)
     filter_fields = ('name',)
     ordering_fields = ('name',)
     ordering = ('name',)
@@ -122,13 +349,7 @@ class CaseFilter(django_filters.FilterSet):
             raise exceptions.ValidationError('CI project is required to exclude by deployed on')
         if not self.form.cleaned_data['release']:
             raise exceptions.ValidationError('Release is required to exclude by deployed on')
-        return queryset.extra(where=["""
-            not exists(
-                select dr.id from core_deploymentreport dr
-                join core_deploymentreport_cases drc on drc.deploymentreport_id = dr.id
-                join core_instance i on dr.instance_id = i.id
-                where dr.status=%s and drc.case_id = core_case.id and i.name = %s)
-        """], params=(DeploymentReport.STATUS_DEPLOYED, value))
+        return queryset.exclude(deployments__instance__name=value)
 
     def filter_deployed_on(self, queryset, value):
         """Implement filter by deployed on instance."""
@@ -136,13 +357,10 @@ class CaseFilter(django_filters.FilterSet):
             raise exceptions.ValidationError('CI project is required to filter by deployed on')
         if not self.form.cleaned_data['release']:
             raise exceptions.ValidationError('Release is required to exclude by deployed on')
-        return queryset.filter(
-            deployment_reports__instance__name=value,
-            deployment_reports__status=DeploymentReport.STATUS_DEPLOYED,
-        )
+        return queryset.filter(deployments__instance__name=value)
 
 
-class CaseViewSet(viewsets.ModelViewSet):
+class CaseViewSet(ConditionalMixin, viewsets.ModelViewSet):
 
     """Return a list of all fogbugz cases in the system.
 
@@ -164,10 +382,15 @@ class CaseViewSet(viewsets.ModelViewSet):
     * project
     * release
     * ci_project
+
+    Unchanged resource is answered with 304 to the conditional GET via **`If-None-Match`** or
+    **`If-Modified-Since`** header.
     """
 
-    queryset = Case.objects.all().distinct()
+    queryset = Case.objects.all()
     serializer_class = CaseSerializer
+    cache_name = 'cases'
+    version_models = (Case, Release, CIProject, Instance, DeploymentReport, DeploymentReport.cases.through)
     filter_fields = ('id', 'title', 'project', 'release', 'ci_project', 'revision')
     ordering_fields = ('id', 'title', 'project', 'release', 'ci_project')
     filter_class = CaseFilter
@@ -187,32 +410,68 @@ class MigrationFilter(django_filters.FilterSet):
     case = django_filters.NumberFilter(name="case__id", lookup_type='exact')
     release = django_filters.NumberFilter(name="case__release__number", lookup_type='lte')
     reviewed = django_filters.BooleanFilter(name="reviewed", lookup_type='exact')
-    status = django_filters.CharFilter(name="reports__status")
+    status = django_filters.MethodFilter(action="filter_status")
     exclude_status = django_filters.MethodFilter(action="filter_exclude_status")
     ci_project = django_filters.CharFilter(
         name="case__ci_project__name", lookup_type='exact')
     instance = django_filters.MethodFilter(action="filter_instance")
+    ancestor_of = django_filters.MethodFilter(action="filter_ancestor_of")
+    descendant_of = django_filters.MethodFilter(action="filter_descendant_of")
 
     class Meta:
         model = Migration
         fields = [
-            'uid', 'case', 'release', 'category', 'ci_project', 'instance', 'status', 'exclude_status', 'reviewed']
+            'uid', 'case', 'release', 'category', 'ci_project', 'instance', 'status', 'exclude_status', 'reviewed',
+            'ancestor_of', 'descendant_of']
+
+    def filter_status(self, queryset, value):
+        """Implement filter by status."""
+        return queryset.extra(where=["""
+            exists(
+                select mr.id from core_migrationreport mr
+                where mr.migration_id = core_migration.id and mr.status = %s)
+        """], params=(value,))
 
     def filter_exclude_status(self, queryset, value):
         """Implement ``exclude`` filter by status."""
         if not self.form.cleaned_data['instance']:
             raise exceptions.ValidationError('Instance is required to exclude status')
-        return queryset.filter(
-            Q(reports__status__gt=value) | Q(reports__status__lt=value) |
-            Q(reports__isnull=True))
+        return queryset.extra(where=["""
+            (exists(
+                select mr.id from core_migrationreport mr
+                where mr.migration_id = core_migration.id and mr.status <> %s)
+            or not exists(
+                select mr.id from core_migrationreport mr
+                where mr.migration_id = core_migration.id))
+        """], params=(value,))
 
     def filter_instance(self, queryset, value):
         """Implement filter by instance."""
-        return queryset.filter(
-            Q(reports__instance__name=value) | Q(reports__isnull=True) | Q(case__ci_project__instances__name=value))
-
-
-class MigrationViewSet(viewsets.ModelViewSet):
+        return queryset.extra(where=["""
+            (exists(
+                select mr.id from core_migrationreport mr
+                join core_instance i on mr.instance_id = i.id
+                where mr.migration_id = core_migration.id and i.name = %s)
+            or not exists(
+                select mr.id from core_migrationreport mr
+                where mr.migration_id = core_migration.id)
+            or exists(
+                select c.id from core_case c
+                join core_instance_ci_projects icp on icp.ciproject_id = c.ci_project_id
+                join core_instance i on icp.instance_id = i.id
+                where c.id = core_migration.case_id and i.name = %s))
+        """], params=(value, value))
+
+    def filter_ancestor_of(self, queryset, value):
+        """Implement filter by the descendant migration uid."""
+        return queryset.filter(descendant_links__descendant__uid=value, descendant_links__depth__gt=0)
+
+    def filter_descendant_of(self, queryset, value):
+        """Implement filter by the ancestor migration uid."""
+        return queryset.filter(ancestor_links__ancestor__uid=value, ancestor_links__depth__gt=0)
+
+
+class MigrationViewSet(ConditionalMixin, viewsets.ModelViewSet):
 
     """Return a list of all migrations in the system.
 
@@ -225,28 +484,147 @@ class MigrationViewSet(viewsets.ModelViewSet):
     * exclude_status
     * ci_project
     * instance
+    * ancestor_of
+    * descendant_of
 
     Orderings (via **`order_by`** query string parameter):
 
     * case
     * category
+
+    Ancestors of the migration are listed from the root via the **`<uid>/ancestors/`** endpoint.
+
+    Status matrix of the migrations on the instances is returned via the **`matrix/`** endpoint.
+
+    Unchanged resource is answered with 304 to the conditional GET via **`If-None-Match`** or
+    **`If-Modified-Since`** header.
     """
 
-    queryset = Migration.objects.all().distinct()
+    queryset = Migration.objects.all()
     serializer_class = MigrationSerializer
+    cache_name = 'migrations'
+    version_models = (
+        Migration, MigrationStep, MigrationReport, MigrationStepReport, MigrationStepReportLogChunk, Case, Release,
+        CIProject, Instance, Instance.ci_projects.through)
     ordering_fields = ('case', 'category')
     ordering = ('case', 'id')
     filter_class = MigrationFilter
-    pagination_class = None
 
+    def get_queryset(self):
+        """Load the related objects of the migrations at once.
+
+        Migration steps are filtered by **`exclude_status`** query string parameter.
+        """
+        exclude_status = self.request.query_params.get('exclude_status')
+        step_reports = MigrationStepReport.objects.select_related('step').prefetch_related('log_chunks')
+        if settings.MIGRATION_REPORT_STORE_LOG:
+            # the log of the calculated report is stored
+            step_reports = step_reports.filter(report__is_calculated=False)
+        steps = MigrationStep.objects.all()
+        if exclude_status:
+            steps = steps.exclude(reports__status=exclude_status)
+        return super(MigrationViewSet, self).get_queryset().select_related(
+            'parent', 'case__ci_project', 'case__release').prefetch_related(
+            Prefetch('steps', queryset=steps),
+            Prefetch('reports', queryset=MigrationReport.objects.select_related('instance')),
+            'reports__instance__ci_projects',
+            Prefetch('reports__step_reports', queryset=step_reports),
+        )
+
+    def create(self, request, *args, **kwargs):
+        """Create or update the migration.
+
+        If the posted migration is the same as the stored one, nothing is written and the stored migration is
+        returned with 200 instead of 201. The response has the content digest as the ETag.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        headers['ETag'] = '"{0}"'.format(serializer.instance.digest)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED if serializer.changed else status.HTTP_200_OK,
+            headers=headers)
+
+    @conditional
+    @cached
     def list(self, request, *args, **kwargs):
-        """Perform topological sort on returned migrations."""
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(Migration.objects.sort(queryset), many=True)
+        """Perform topological sort on returned migrations.
+
+        If the page is requested, only the uids are sorted and only the migrations of the page are loaded.
+        """
+        queryset = self.get_queryset()
+        try:
+            if self.paginator.get_page_size(request) is None:
+                serializer = self.get_serializer(
+                    Migration.objects.sort(self.filter_queryset(queryset), parents_queryset=queryset), many=True)
+                return Response(serializer.data)
+            uids = self.paginator.paginate_keys(Migration.objects.sort_uids(self.filter_queryset(queryset)), request)
+        except MigrationSortError as e:
+            return Response(dict(detail=str(e), uids=sorted(e.errors)), status=status.HTTP_409_CONFLICT)
+        migrations = {migration.uid: migration for migration in queryset.filter(uid__in=uids)}
+        serializer = self.get_serializer([migrations[uid] for uid in uids], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @detail_route(methods=['get'])
+    @conditional
+    def ancestors(self, request, pk=None):
+        """List the ancestors of the migration given by the uid, starting from the root."""
+        migration = get_object_or_404(Migration, uid=pk)
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            descendant_links__descendant=migration, descendant_links__depth__gt=0).order_by(
+            '-descendant_links__depth')
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-
-class MigrationReportViewSet(viewsets.ReadOnlyModelViewSet):
+    @list_route(methods=['get'])
+    @conditional
+    def matrix(self, request):
+        """Get the status matrix of the migrations on the instances.
+
+        Filters (via **`<parameter>`** query string arguments):
+
+        * ci_project
+        * release_from
+        * release_to
+
+        All the migrations in the release range are listed against all the instances of the CI project and the
+        instances the migrations were reported on. Statuses are listed per migration in the order of the instances,
+        null if the migration was not reported on the instance. The datetime is the one of the latest status change.
+        """
+        migrations = Migration.objects.all()
+        instances = Instance.objects.all()
+        if 'ci_project' in request.query_params:
+            migrations = migrations.filter(case__ci_project__name=request.query_params['ci_project'])
+            instances = instances.filter(ci_projects__name=request.query_params['ci_project'])
+        try:
+            for param, lookup in (('release_from', 'gte'), ('release_to', 'lte')):
+                if param in request.query_params:
+                    migrations = migrations.filter(**{
+                        'case__release__number__' + lookup: int(request.query_params[param])})
+        except ValueError:
+            raise exceptions.ValidationError('Release range should be integers')
+        # the migrations are joined with their statuses, so the ones without the statuses are listed as well
+        rows = list(migrations.order_by('case__release__number', 'case', 'id').values_list(
+            'uid', 'statuses__instance__name', 'statuses__status', 'statuses__datetime'))
+        statuses = collections.OrderedDict()
+        for uid, instance, status_, _ in rows:
+            migration_statuses = statuses.setdefault(uid, {})
+            if instance is not None:
+                migration_statuses[instance] = status_
+        instances = sorted(set(instances.values_list('name', flat=True)).union(
+            instance for migration_statuses in statuses.values() for instance in migration_statuses))
+        return Response(collections.OrderedDict([
+            ('instances', instances),
+            ('migrations', list(statuses)),
+            ('statuses', [
+                [migration_statuses.get(instance) for instance in instances]
+                for migration_statuses in statuses.values()]),
+            ('datetime', max((row[3] for row in rows if row[3] is not None), default=None)),
+        ]))
+
+
+class MigrationReportViewSet(DeferredLogMixin, viewsets.ReadOnlyModelViewSet):
 
     """Return a list of all migration reports in the system.
 
@@ -263,6 +641,8 @@ class MigrationReportViewSet(viewsets.ReadOnlyModelViewSet):
     * instance
     * status
     * datetime
+
+    The log is not listed unless it's requested via **`include=log`** query string parameter.
     """
 
     queryset = MigrationReport.objects.all()
@@ -272,7 +652,7 @@ class MigrationReportViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ('migration', 'instance', 'datetime', 'id')
 
 
-class MigrationStepReportViewSet(viewsets.ModelViewSet):
+class MigrationStepReportViewSet(LogChunksMixin, DeferredLogMixin, viewsets.ModelViewSet):
 
     """Return a list of all migration reports in the system.
 
@@ -287,16 +667,33 @@ class MigrationStepReportViewSet(viewsets.ModelViewSet):
     * report
     * status
     * datetime
+
+    The log is not listed unless it's requested via **`include=log`** query string parameter.
+
+    All the step reports of the migration application on the instance can be posted at once to the
+    **`bulk/`** endpoint as `{"report": {"migration": ..., "instance": ...}, "step_reports": [...]}`.
+
+    The step report log can be appended in chunks and tailed via the **`<id>/log/`** endpoint.
     """
 
     queryset = MigrationStepReport.objects.all()
+    log_related = ('log_chunks',)
     serializer_class = MigrationStepReportSerializer
     filter_fields = ('report', 'status', 'datetime')
     ordering_fields = ('report', 'status', 'datetime')
-    ordering = ('report', 'datetime', 'id')
+    ordering = ('report', 'step', 'datetime', 'id')
 
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """Create or update all the step reports of the migration application at once."""
+        serializer = MigrationStepReportBulkSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        step_reports = serializer.save()
+        return Response(
+            self.get_serializer(step_reports, many=True).data, status=status.HTTP_201_CREATED)
 
-class DeploymentReportViewSet(viewsets.ModelViewSet):
+
+class DeploymentReportViewSet(LogChunksMixin, DeferredLogMixin, viewsets.ModelViewSet):
 
     """Return a list of all deployment reports in the system.
 
@@ -312,9 +709,14 @@ class DeploymentReportViewSet(viewsets.ModelViewSet):
     * instance
     * status
     * datetime
+
+    The log is not listed unless it's requested via **`include=log`** query string parameter.
+
+    The report log can be appended in chunks and tailed via the **`<id>/log/`** endpoint.
     """
 
     queryset = DeploymentReport.objects.all()
+    log_related = ('log_chunks',)
     serializer_class = DeploymentReportSerializer
     filter_fields = ('release', 'instance', 'status', 'datetime')
     ordering_fields = ('instance', 'status', 'datetime')
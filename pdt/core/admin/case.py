@@ -7,7 +7,6 @@ from django.utils.translation import ugettext_lazy as _
 
 from ..models import (
     Case,
-    DeploymentReport,
 )
 from ..tasks import update_case_to_fogbugz
 
@@ -34,7 +33,8 @@ class CaseAdmin(TinyMCEMixin, admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize the number of queries made."""
         qs = super(CaseAdmin, self).get_queryset(request)
-        return qs.select_related('release', 'ci_project', 'migration').prefetch_related('tagged_items__tag')
+        return qs.select_related('release', 'ci_project', 'migration').prefetch_related(
+            'tagged_items__tag', 'deployments__instance__ci_projects')
 
     def title(self):
         """Get case title link."""
@@ -46,17 +46,17 @@ class CaseAdmin(TinyMCEMixin, admin.ModelAdmin):
 
     def deployed_on(self):
         """Case 'deployed on' column."""
+        instances = sorted((
+            deployment.instance for deployment in self.deployments.all()
+            if self.ci_project in deployment.instance.ci_projects.all()),
+            key=lambda instance: instance.name) if self.release else []
         return mark_safe(
             '<ul>{0}</ul>'.format(
                 "".join('<li><a href="{url}">{ci_project}: {name}</a></li>'.format(
                     url=escape(reverse("admin:core_instance_change", args=(instance.id,))),
                     ci_project=escape(self.ci_project),
                     name=escape(instance.name),
-                ) for instance in (
-                    self.ci_project.instances.filter(
-                        deployment_reports__cases__in=(self,),
-                        deployment_reports__status=DeploymentReport.STATUS_DEPLOYED).distinct()
-                    if self.release else []))
+                ) for instance in instances)
             )
         )
 
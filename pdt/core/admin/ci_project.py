@@ -9,7 +9,7 @@ class CIProjectAdmin(admin.ModelAdmin):
 
     """CI project admin interface class."""
 
-    list_display = ('id', 'name', 'description', instances_column())
+    list_display = ('id', 'name', 'description', instances_column(), 'synced_date')
     list_filter = ('instances__name',)
     search_fields = ('id', 'name', 'description')
 
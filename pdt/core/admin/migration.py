@@ -18,6 +18,7 @@ from ..models import (
     MigrationStep,
     PostDeployMigrationStep,
     PreDeployMigrationStep,
+    touch_model_versions,
 )
 
 from .mixins import (
@@ -39,6 +40,7 @@ class MigrationStepForm(forms.ModelForm):
     class Meta:
         abstract = True
         fields = '__all__'
+        exclude = ('phase',)
         widgets = {
             "code": AceWidget(**ACE_WIDGET_PARAMS),
             "position": forms.HiddenInput,
@@ -82,11 +84,22 @@ class FinalMigrationStepForm(MigrationStepForm):
         model = FinalMigrationStep
 
 
+class MigrationStepFormSet(forms.BaseInlineFormSet):
+
+    """Migration step formset of the phase."""
+
+    @classmethod
+    def get_default_prefix(cls):
+        """Prefix the forms with the migration accessor of the phase steps instead of the common one."""
+        return dict((phase, name) for name, phase in MigrationStep.PHASE_ACCESSORS)[cls.model.PHASE]
+
+
 class PreDeployMigrationStepInline(admin.StackedInline):
 
     """Pre-deploy migration step inline."""
 
     form = PreDeployMigrationStepForm
+    formset = MigrationStepFormSet
     model = PreDeployMigrationStep
     extra = 0
     sortable_field_name = "position"
@@ -99,6 +112,7 @@ class PostDeployMigrationStepInline(admin.StackedInline):
     """Post-deploy migration step inline."""
 
     form = PostDeployMigrationStepForm
+    formset = MigrationStepFormSet
     model = PostDeployMigrationStep
     extra = 0
     sortable_field_name = "position"
@@ -111,6 +125,7 @@ class FinalMigrationStepInline(admin.StackedInline):
     """Final migration step inline."""
 
     form = FinalMigrationStepForm
+    formset = MigrationStepFormSet
     model = FinalMigrationStep
     extra = 0
     sortable_field_name = "position"
@@ -188,6 +203,7 @@ class MigrationAdmin(admin.ModelAdmin):
         :param queryset: queryset of the migrations to mark
         """
         queryset.update(reviewed=True)
+        touch_model_versions(Migration)
     mark_migrations_reviewed.short_description = _("Mark selected migrations as reviewed")
 
     def mark_migrations_not_reviewed(self, request, queryset):
@@ -197,6 +213,7 @@ class MigrationAdmin(admin.ModelAdmin):
         :param queryset: queryset of the migrations to unmark
         """
         queryset.update(reviewed=False)
+        touch_model_versions(Migration)
     mark_migrations_not_reviewed.short_description = _("Mark selected migrations as not reviewed")
 
     class StampForm(forms.Form):
@@ -1,5 +1,6 @@
 """PDT core admin class mixins."""
 from django import forms
+from django.contrib.admin.views.main import ChangeList
 from django.utils.translation import ugettext_lazy as _
 
 import embedded_media as emb
@@ -22,6 +23,15 @@ class TinyMCEMixin(object):
         ]
 
 
+class DeferredLogChangeList(ChangeList):
+
+    """Change list which does not load the logs."""
+
+    def get_queryset(self, request):
+        """Defer the log column."""
+        return super(DeferredLogChangeList, self).get_queryset(request).defer('log')
+
+
 class LogAdminMixin(object):
 
     """Mixin for adding rendered log field."""
@@ -53,9 +63,14 @@ class LogAdminMixin(object):
         self.exclude = ('log',) if obj and obj.id else ('rendered_log', )
         return ('rendered_log', ) if obj and obj.id else ()
 
+    def get_changelist(self, request, **kwargs):
+        """Do not load the logs in the change list."""
+        return DeferredLogChangeList
+
     def rendered_log(self, instance):
         """Render ansi colors as html."""
-        converted = Ansi2HTMLConverter(dark_bg=False).convert(instance.log, full=False)
+        converted = Ansi2HTMLConverter(dark_bg=False).convert(
+            instance.get_log() if hasattr(instance, 'get_log') else instance.log, full=False)
         return '<div class="ansi2html-container"><pre class="ansi2html-content">{0}</pre><div>'.format(
             converted.replace('/span> <span', '/span>&nbsp;<span')
         )
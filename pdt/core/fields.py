@@ -0,0 +1,62 @@
+"""PDT core model fields."""
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+
+COMPRESSED_PREFIX = 'zlib:'
+
+
+def compress(value):
+    """Compress the text.
+
+    :param value: text to compress
+    :type value: str
+
+    :return: compressed text prefixed with the compression marker
+    :rtype: str
+    """
+    data = zlib.compress(value.encode('utf-8'), settings.LOG_COMPRESSION_LEVEL)
+    return COMPRESSED_PREFIX + base64.b64encode(data).decode('ascii')
+
+
+def decompress(value):
+    """Decompress the text if it's compressed.
+
+    :param value: stored text
+    :type value: str
+
+    :return: original text
+    :rtype: str
+    """
+    if value and value.startswith(COMPRESSED_PREFIX):
+        return zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    return value
+
+
+class CompressedTextField(models.TextField):
+
+    """Text field which is stored compressed in the text column.
+
+    Values shorter than ``LOG_COMPRESSION_MIN_LENGTH`` or not shrinking after the compression are stored as is,
+    as well as the values stored before the field was compressed, so both are read transparently.
+    """
+
+    def from_db_value(self, value, expression, connection, context):  # pylint: disable=W0613
+        """Decompress the stored value."""
+        return decompress(value)
+
+    def get_prep_value(self, value):
+        """Compress the value to store."""
+        value = super(CompressedTextField, self).get_prep_value(value)
+        if value is None:
+            return value
+        # the value which looks compressed is always compressed to be read back as is
+        escape = value.startswith(COMPRESSED_PREFIX)
+        if escape or len(value) >= settings.LOG_COMPRESSION_MIN_LENGTH:
+            compressed = compress(value)
+            if escape or len(compressed) < len(value):
+                return compressed
+        return value
@@ -0,0 +1,238 @@
+"""Pooled Fogbugz API client."""
+import collections
+import contextlib
+import http.client
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+
+import fogbugz
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_STATUS_CODES = frozenset((429, 503))
+
+# API commands which are safe to retry, others could be applied twice if the response is lost
+IDEMPOTENT_COMMANDS = frozenset((
+    'search', 'viewCase', 'listFilters', 'listProjects', 'listAreas', 'listCategories', 'listPriorities',
+    'listPeople', 'listStatuses', 'listFixFors', 'listMilestones'))
+
+
+class KeepAliveHandler(urllib.request.HTTPHandler, urllib.request.HTTPSHandler):
+
+    """Url opener handler which reuses a persistent connection per host."""
+
+    def __init__(self):
+        """Initialize new instance."""
+        urllib.request.HTTPHandler.__init__(self)
+        urllib.request.HTTPSHandler.__init__(self)
+        self.connections = {}
+
+    def http_open(self, req):
+        """Open http url."""
+        return self.keep_alive_open(http.client.HTTPConnection, req)
+
+    def https_open(self, req):
+        """Open https url."""
+        return self.keep_alive_open(http.client.HTTPSConnection, req)
+
+    def keep_alive_open(self, connection_class, req):
+        """Perform the request over the persistent connection.
+
+        The request is resent over the new connection only if sending it over the reused one failed, as the server
+        could have already processed the request which response failed.
+        """
+        key = (connection_class, req.host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update(req.headers)
+        headers['Connection'] = 'keep-alive'
+        for _ in range(2):
+            connection = self.connections.get(key)
+            reused = connection is not None
+            if not reused:
+                connection = self.connections[key] = connection_class(req.host, timeout=req.timeout)
+            try:
+                connection.request(req.get_method(), req.selector, req.data, headers)
+            except (http.client.HTTPException, OSError) as e:
+                self.drop(key)
+                if reused:
+                    # the persistent connection was dropped by the server
+                    continue
+                raise urllib.error.URLError(e)
+            try:
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                self.drop(key)
+                raise urllib.error.URLError(e)
+            response.url = req.get_full_url()
+            response.msg = response.reason
+            return response
+
+    def drop(self, key):
+        """Close and forget the connection."""
+        self.connections.pop(key).close()
+
+    def close(self):
+        """Close all the connections."""
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+class CircuitOpenError(fogbugz.FogBugzConnectionError):
+
+    """Fogbugz API calls are suspended after too many consecutive failures."""
+
+
+class PooledClient(object):
+
+    """Fogbugz client proxy which performs the API calls through the pool."""
+
+    def __init__(self, pool, client):
+        """Initialize new instance."""
+        self.pool = pool
+        self.client = client
+
+    def __getattr__(self, name):
+        """Return the API call handler, only the idempotent commands are retried."""
+        handler = getattr(self.client, name)
+        return lambda **kwargs: self.pool.call(handler, idempotent=name in IDEMPOTENT_COMMANDS, **kwargs)
+
+
+class FogBugzPool(object):
+
+    """Per process pool of the Fogbugz API clients.
+
+    Clients are reused between the calls together with their keep-alive connections, the number of the concurrent
+    clients is bounded, connection failures and throttling responses are retried with exponential backoff and
+    after too many consecutive failures the circuit breaker suspends the API calls for a while.
+    """
+
+    def __init__(
+            self, size=None, timeout=None, retries=None, backoff=None, failure_threshold=None, reset_timeout=None):
+        """Initialize new instance."""
+        self.size = size or settings.FOGBUGZ_POOL_SIZE
+        self.timeout = timeout or settings.FOGBUGZ_POOL_TIMEOUT
+        self.retries = settings.FOGBUGZ_RETRIES if retries is None else retries
+        self.backoff = settings.FOGBUGZ_RETRY_BACKOFF if backoff is None else backoff
+        self.failure_threshold = failure_threshold or settings.FOGBUGZ_CIRCUIT_BREAKER_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.FOGBUGZ_CIRCUIT_BREAKER_TIMEOUT
+        self.clear()
+
+    def clear(self):  # pylint: disable=W0201
+        """Drop all the clients and reset the counters."""
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(self.size)
+        self.idle = collections.deque()
+        self.failures = 0
+        self.opened_at = None
+        self.counters = collections.Counter()
+
+    def stats(self):
+        """Get the pool counters.
+
+        :return: hits, misses, calls, retries, failures and the total and average call latency in seconds
+        :rtype: dict
+        """
+        stats = dict(self.counters, latency=round(self.counters['latency'], 3))
+        stats['average_latency'] = round(self.counters['latency'] / self.counters['calls'], 3) \
+            if self.counters['calls'] else 0
+        return stats
+
+    def create_client(self):
+        """Create new Fogbugz client with the keep-alive connection."""
+        client = self.call(fogbugz.FogBugz, settings.AUTH_FOGBUGZ_SERVER, settings.FOGBUGZ_TOKEN)
+        # the client is connected to get the API url, from now on requests reuse the connection
+        client._opener = urllib.request.build_opener(KeepAliveHandler())  # pylint: disable=W0212
+        return client
+
+    @contextlib.contextmanager
+    def client(self):
+        """Check out the client from the pool."""
+        if self.pid != os.getpid():
+            # forked worker process should not share the connections with the parent
+            self.clear()
+        if not self.semaphore.acquire(timeout=self.timeout):
+            raise fogbugz.FogBugzConnectionError('Timed out waiting for a free Fogbugz client')
+        try:
+            with self.lock:
+                client = self.idle.pop() if self.idle else None
+            if client is None:
+                self.counters['misses'] += 1
+                client = self.create_client()
+            else:
+                self.counters['hits'] += 1
+            broken = False
+            try:
+                yield PooledClient(self, client)
+            except fogbugz.FogBugzConnectionError:
+                # the connection state is unknown, so the client is not reused
+                broken = True
+                raise
+            finally:
+                if not broken:
+                    with self.lock:
+                        self.idle.append(client)
+        finally:
+            self.semaphore.release()
+
+    def call(self, handler, *args, idempotent=True, **kwargs):
+        """Call the API handler with retries and the circuit breaker.
+
+        :param handler: API call handler
+        :param idempotent: the call is safe to retry
+        :type idempotent: bool
+        """
+        with self.lock:
+            if self.opened_at is not None:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError('Fogbugz API calls are suspended after {0} consecutive failures'.format(
+                        self.failures))
+                # half-open: let the call through to check if the API has recovered
+                self.opened_at = None
+        retries = self.retries if idempotent else 0
+        for attempt in range(retries + 1):
+            started = time.time()
+            try:
+                result = handler(*args, **kwargs)
+            except fogbugz.FogBugzConnectionError as e:
+                error = e
+            else:
+                with self.lock:
+                    self.failures = 0
+                return result
+            finally:
+                self.counters['calls'] += 1
+                self.counters['latency'] += time.time() - started
+            if attempt < retries:
+                self.counters['retries'] += 1
+                delay = self.get_retry_delay(error, attempt)
+                logger.warning('Fogbugz API call failed, retrying in %s seconds: %s', delay, error)
+                time.sleep(delay)
+        with self.lock:
+            self.counters['failures'] += 1
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                logger.error('Suspending Fogbugz API calls for %s seconds', self.reset_timeout)
+                self.opened_at = time.time()
+        raise error
+
+    def get_retry_delay(self, error, attempt):
+        """Get the delay before the next attempt, respecting the throttling response if there's one."""
+        delay = self.backoff * 2 ** attempt
+        reason = error.args[0] if error.args else None
+        if isinstance(reason, urllib.error.HTTPError) and reason.code in THROTTLING_STATUS_CODES:
+            retry_after = reason.headers.get('Retry-After', '') if reason.headers else ''
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+        return delay
+
+
+fogbugz_pool = FogBugzPool()
@@ -0,0 +1,67 @@
+"""Compress the report logs stored before the compression was enabled."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pdt.core.fields import COMPRESSED_PREFIX
+from pdt.core.models import (
+    DeploymentReport,
+    MigrationReport,
+    MigrationStepReport,
+)
+
+
+class Command(BaseCommand):
+
+    """Compress the report logs and report the bytes saved."""
+
+    help = 'Compress the report logs stored before the compression was enabled and report the bytes saved.'
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--batch-size', type=int, default=500, help='Number of the reports updated in one transaction.')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False, help='Only report the bytes which would be saved.')
+
+    def handle(self, *args, **options):
+        """Compress the logs of all the report models."""
+        total_original = total_stored = 0
+        for model in (MigrationReport, MigrationStepReport, DeploymentReport):
+            rows, original, stored = self.compress_logs(model, options['batch_size'], options['dry_run'])
+            self.stdout.write('{0}: {1} logs, {2} bytes stored as {3} bytes, {4} bytes saved'.format(
+                model._meta.verbose_name_plural, rows, original, stored, original - stored))  # pylint: disable=W0212
+            total_original += original
+            total_stored += stored
+        self.stdout.write('Total: {0} bytes stored as {1} bytes, {2} bytes saved'.format(
+            total_original, total_stored, total_original - total_stored))
+
+    def compress_logs(self, model, batch_size, dry_run):
+        """Compress the logs of the report model.
+
+        :param model: report model
+        :param batch_size: number of the reports updated in one transaction
+        :type batch_size: int
+        :param dry_run: only calculate the bytes saved
+        :type dry_run: bool
+
+        :return: number of the logs, original and stored size in bytes
+        :rtype: tuple
+        """
+        field = model._meta.get_field('log')  # pylint: disable=W0212
+        ids = list(model.objects.exclude(log='').exclude(
+            log__startswith=COMPRESSED_PREFIX).order_by('id').values_list('id', flat=True))
+        rows = original = stored = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                # update bypasses the report signals, the log content does not change
+                for report_id, log in model.objects.filter(
+                        id__in=ids[start:start + batch_size]).values_list('id', 'log'):
+                    value = field.get_prep_value(log)
+                    if value == log:
+                        continue
+                    rows += 1
+                    original += len(log.encode('utf-8'))
+                    stored += len(value.encode('utf-8'))
+                    if not dry_run:
+                        model.objects.filter(id=report_id).update(log=log)
+        return rows, original, stored
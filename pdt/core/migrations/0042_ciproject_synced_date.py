@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_auto_20151021_0512'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ciproject',
+            name='synced_date',
+            field=models.DateTimeField(
+                verbose_name='Last synced date', null=True, blank=True, editable=False,
+                help_text='Cases edited in Fogbugz before this date are considered to be up to date.'),
+        ),
+    ]
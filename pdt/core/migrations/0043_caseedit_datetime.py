@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_ciproject_synced_date'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='caseedit',
+            options={'verbose_name': 'Case edit', 'verbose_name_plural': 'Case edits', 'ordering': ['datetime', 'id']},
+        ),
+        migrations.AddField(
+            model_name='caseedit',
+            name='datetime',
+            field=models.DateTimeField(default=django.utils.timezone.now, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='caseedit',
+            index_together=set([('datetime', 'case')]),
+        ),
+    ]
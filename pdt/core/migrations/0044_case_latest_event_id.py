@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_caseedit_datetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='case',
+            name='latest_event_id',
+            field=models.PositiveIntegerField(
+                null=True, blank=True, editable=False,
+                help_text='Latest Fogbugz case event, the case edits are only pushed if there are no newer events.'),
+        ),
+    ]
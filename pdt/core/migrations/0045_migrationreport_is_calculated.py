@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_case_latest_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='migrationreport',
+            name='is_calculated',
+            field=models.BooleanField(default=True, db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_migrationreport_is_calculated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeploymentReportLogChunk',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('offset', models.PositiveIntegerField()),
+                ('log', models.TextField()),
+                ('datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('report', models.ForeignKey(related_name='log_chunks', to='core.DeploymentReport')),
+            ],
+            options={
+                'ordering': ['report', 'offset'],
+                'verbose_name': 'Deployment report log chunk',
+                'verbose_name_plural': 'Deployment report log chunks',
+            },
+        ),
+        migrations.CreateModel(
+            name='MigrationStepReportLogChunk',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('offset', models.PositiveIntegerField()),
+                ('log', models.TextField()),
+                ('datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('report', models.ForeignKey(related_name='log_chunks', to='core.MigrationStepReport')),
+            ],
+            options={
+                'ordering': ['report', 'offset'],
+                'verbose_name': 'Migration step report log chunk',
+                'verbose_name_plural': 'Migration step report log chunks',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='migrationstepreportlogchunk',
+            unique_together=set([('report', 'offset')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deploymentreportlogchunk',
+            unique_together=set([('report', 'offset')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import pdt.core.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_log_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deploymentreport',
+            name='log',
+            field=pdt.core.fields.CompressedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='migrationreport',
+            name='log',
+            field=pdt.core.fields.CompressedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='migrationstepreport',
+            name='log',
+            field=pdt.core.fields.CompressedTextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_closure(apps, schema_editor):
+    """Build the closure of the existing migrations."""
+    Migration = apps.get_model('core', 'Migration')
+    MigrationClosure = apps.get_model('core', 'MigrationClosure')
+    parents = dict(Migration.objects.values_list('id', 'parent'))
+    links = []
+    for migration_id in parents:
+        ancestor_id, depth, seen = migration_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(MigrationClosure(ancestor_id=ancestor_id, descendant_id=migration_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    MigrationClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_compressed_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationClosure',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', to='core.Migration')),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', to='core.Migration')),
+            ],
+            options={
+                'verbose_name': 'Migration closure',
+                'verbose_name_plural': 'Migration closures',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='migrationclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='migrationclosure',
+            index_together=set([('descendant', 'depth')]),
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
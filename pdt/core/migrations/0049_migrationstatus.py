@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_statuses(apps, schema_editor):
+    """Build the status matrix of the existing migration reports."""
+    MigrationReport = apps.get_model('core', 'MigrationReport')
+    MigrationStatus = apps.get_model('core', 'MigrationStatus')
+    MigrationStatus.objects.bulk_create(
+        (MigrationStatus(migration_id=migration_id, instance_id=instance_id, status=status, datetime=datetime)
+         for migration_id, instance_id, status, datetime in MigrationReport.objects.values_list(
+             'migration', 'instance', 'status', 'datetime').iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_migrationclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationStatus',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('status', models.CharField(max_length=3, choices=[
+                    ('apl', 'Applied'), ('prt', 'Applied partially'), ('err', 'Error')])),
+                ('datetime', models.DateTimeField()),
+                ('instance', models.ForeignKey(related_name='migration_statuses', to='core.Instance')),
+                ('migration', models.ForeignKey(related_name='statuses', to='core.Migration')),
+            ],
+            options={
+                'verbose_name': 'Migration status',
+                'verbose_name_plural': 'Migration statuses',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='migrationstatus',
+            unique_together=set([('migration', 'instance')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='migrationstatus',
+            index_together=set([('instance', 'migration')]),
+        ),
+        migrations.RunPython(build_statuses, migrations.RunPython.noop),
+    ]
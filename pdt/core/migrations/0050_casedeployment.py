@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+def build_deployments(apps, schema_editor):
+    """Build the last deployments of the cases from the existing deployment reports."""
+    DeploymentReport = apps.get_model('core', 'DeploymentReport')
+    CaseDeployment = apps.get_model('core', 'CaseDeployment')
+    last = {}
+    for case_id, instance_id, report_id, datetime in DeploymentReport.cases.through.objects.filter(
+            deploymentreport__status='dpl').order_by('deploymentreport__datetime', 'deploymentreport').values_list(
+            'case', 'deploymentreport__instance', 'deploymentreport', 'deploymentreport__datetime').iterator():
+        last[case_id, instance_id] = report_id, datetime
+    CaseDeployment.objects.bulk_create(
+        (CaseDeployment(case_id=case_id, instance_id=instance_id, report_id=report_id, datetime=datetime)
+         for (case_id, instance_id), (report_id, datetime) in last.items()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0049_migrationstatus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseDeployment',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, auto_created=True, verbose_name='ID')),
+                ('datetime', models.DateTimeField()),
+                ('case', models.ForeignKey(related_name='deployments', to='core.Case')),
+                ('instance', models.ForeignKey(related_name='case_deployments', to='core.Instance')),
+                ('report', models.ForeignKey(
+                    related_name='case_deployments', null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    to='core.DeploymentReport')),
+            ],
+            options={
+                'verbose_name': 'Case deployment',
+                'verbose_name_plural': 'Case deployments',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='casedeployment',
+            unique_together=set([('case', 'instance')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='casedeployment',
+            index_together=set([('instance', 'case')]),
+        ),
+        migrations.RunPython(build_deployments, migrations.RunPython.noop),
+    ]
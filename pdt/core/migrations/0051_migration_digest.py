@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0050_casedeployment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='migration',
+            name='digest',
+            field=models.CharField(max_length=40, blank=True, editable=False),
+        ),
+    ]
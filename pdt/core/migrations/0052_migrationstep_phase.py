@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+COPY_PHASE_SQL = """
+    update core_migrationstep set phase = {phase}, step_migration_id = (
+        select s.migration_id from core_{table} s where s.migrationstep_ptr_id = core_migrationstep.id)
+    where id in (select migrationstep_ptr_id from core_{table})
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0051_migration_digest'),
+    ]
+
+    operations = [
+        # the child models still have the migration field, so the base one is added under the temporary name
+        migrations.AddField(
+            model_name='migrationstep',
+            name='step_migration',
+            field=models.ForeignKey(related_name='+', to='core.Migration', null=True),
+        ),
+        migrations.AddField(
+            model_name='migrationstep',
+            name='phase',
+            field=models.PositiveSmallIntegerField(
+                choices=[(1, 'Pre-deploy'), (2, 'Post-deploy'), (3, 'Final')], null=True),
+        ),
+        migrations.RunSQL([
+            COPY_PHASE_SQL.format(phase=phase, table=table) for phase, table in (
+                (1, 'predeploymigrationstep'),
+                (2, 'postdeploymigrationstep'),
+                (3, 'finalmigrationstep'),
+            )], reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0052_migrationstep_phase'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PreDeployMigrationStep',
+        ),
+        migrations.DeleteModel(
+            name='PostDeployMigrationStep',
+        ),
+        migrations.DeleteModel(
+            name='FinalMigrationStep',
+        ),
+        migrations.RenameField(
+            model_name='migrationstep',
+            old_name='step_migration',
+            new_name='migration',
+        ),
+        migrations.AlterField(
+            model_name='migrationstep',
+            name='migration',
+            field=models.ForeignKey(related_name='steps', to='core.Migration'),
+        ),
+        migrations.AlterField(
+            model_name='migrationstep',
+            name='phase',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Pre-deploy'), (2, 'Post-deploy'), (3, 'Final')]),
+        ),
+        migrations.AlterModelOptions(
+            name='migrationstep',
+            options={
+                'ordering': ['phase', 'position'],
+                'verbose_name': 'Migration step',
+                'verbose_name_plural': 'Migration steps',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='migrationstep',
+            index_together=set([('id', 'position'), ('migration', 'phase', 'position')]),
+        ),
+        migrations.CreateModel(
+            name='PreDeployMigrationStep',
+            fields=[],
+            options={
+                'proxy': True,
+                'verbose_name': 'Pre-deploy migration step',
+                'verbose_name_plural': 'Pre-deploy migration steps',
+            },
+            bases=('core.migrationstep',),
+        ),
+        migrations.CreateModel(
+            name='PostDeployMigrationStep',
+            fields=[],
+            options={
+                'proxy': True,
+                'verbose_name': 'Post-deploy migration step',
+                'verbose_name_plural': 'Post-deploy migration steps',
+            },
+            bases=('core.migrationstep',),
+        ),
+        migrations.CreateModel(
+            name='FinalMigrationStep',
+            fields=[],
+            options={
+                'proxy': True,
+                'verbose_name': 'Final migration step',
+                'verbose_name_plural': 'Final migration steps',
+            },
+            bases=('core.migrationstep',),
+        ),
+    ]
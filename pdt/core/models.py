@@ -1,11 +1,16 @@
 """PDT core models."""
 from itertools import chain
+import hashlib
+import json
 import logging
+import threading
 
 from django.db import transaction
 from django.db import models, DatabaseError
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
 from django.utils.functional import cached_property
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
@@ -19,7 +24,7 @@ from post_office.validators import validate_email_with_name
 from post_office.fields import CommaSeparatedEmailField
 
 from colorama import Fore
-from toposort import toposort_flatten
+from toposort import toposort
 
 from taggit.managers import TaggableManager
 
@@ -29,6 +34,9 @@ from model_utils import FieldTracker
 
 import fogbugz
 
+from .fields import CompressedTextField
+from .fogbugz_client import fogbugz_pool
+
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +75,9 @@ class CIProject(models.Model):
 
     name = models.CharField(max_length=255, unique=True, db_index=True)
     description = models.TextField(blank=True)
+    synced_date = models.DateTimeField(
+        _('Last synced date'), null=True, blank=True, editable=False,
+        help_text=_('Cases edited in Fogbugz before this date are considered to be up to date.'))
 
     @staticmethod
     def autocomplete_search_fields():
@@ -137,6 +148,18 @@ class CaseManager(models.Manager):
 
     """Case manager to allow automatic fetch from Fogbugz."""
 
+    @property
+    def case_info_columns(self):
+        """Fogbugz search columns needed to parse the case info."""
+        return (
+            'sTitle,sOriginalTitle,sFixFor,dtFixFor,sProject,sArea,dtLastUpdated,ixBugEventLatest,tags,{0},{1}'
+        ).format(
+            settings.FOGBUGZ_CI_PROJECT_FIELD_ID,
+            settings.FOGBUGZ_REVISION_FIELD_ID,
+        )
+
+    edit_columns = 'dtLastUpdated,ixBugEventLatest,tags'
+
     def get_case_info(self, case_id, fb=None):
         """Get case info from the Fogbugz API.
 
@@ -145,15 +168,11 @@ class CaseManager(models.Manager):
         :param fb: optional fogbugz client instance
         """
         if fb is None:
-            fb = fogbugz.FogBugz(
-                settings.AUTH_FOGBUGZ_SERVER,
-                settings.FOGBUGZ_TOKEN)
+            with fogbugz_pool.client() as fb:
+                return self.get_case_info(case_id, fb=fb)
         resp = fb.search(
             q=case_id,
-            cols='sTitle,sOriginalTitle,sFixFor,dtFixFor,sProject,sArea,dtLastUpdated,tags,{0},{1}'.format(
-                settings.FOGBUGZ_CI_PROJECT_FIELD_ID,
-                settings.FOGBUGZ_REVISION_FIELD_ID,
-            ),
+            cols=self.case_info_columns,
             max=1
         )
         case = resp.cases.find('case')
@@ -161,14 +180,18 @@ class CaseManager(models.Manager):
             raise ValidationError('Case with such id cannot be found', case_id)
         return self.parse_case_info(case)
 
-    def parse_case_info(self, case):
+    def parse_case_info(self, case, cache=None):
         """Parse case info given the case xml.
 
         :param case: beautifulsoup object represing the case xml node
+        :param cache: optional dictionary to reuse releases and CI projects between the calls
+        :type cache: dict
 
         :return: case info dictionary
         :rtype: dict
         """
+        if cache is None:
+            cache = {}
         case_id = int(case.attrs['ixbug'])
         if not case.sfixfor.string:
             raise ValidationError('Case milestone is not set', case_id)
@@ -177,7 +200,10 @@ class CaseManager(models.Manager):
         release_datetime = parse_datetime(case.dtfixfor.string) if case.dtfixfor.string else None
         release_number = case.sfixfor.string if case.sfixfor.string.isdigit() else None
         if release_number:
-            release, _ = Release.objects.get_or_create(number=release_number)
+            key = (Release, release_number)
+            if key not in cache:
+                cache[key] = Release.objects.get_or_create(number=release_number)[0]
+            release = cache[key]
             if release_datetime and release.datetime != release_datetime:
                 release.datetime = release_datetime
                 release.save()
@@ -192,12 +218,75 @@ class CaseManager(models.Manager):
             title=case.stitle.string,
             description=case.soriginaltitle.string,
             modified_date=parse_datetime(case.dtlastupdated.string) if case.dtlastupdated.string else None,
+            latest_event_id=int(case.ixbugeventlatest.string) if case.ixbugeventlatest.string else None,
             tags=frozenset(tag.string.strip() for tag in case.tags.findAll('tag'))
         )
         if ci_project:
-            info['ci_project'] = CIProject.objects.get_or_create(name=ci_project)[0]
+            key = (CIProject, ci_project)
+            if key not in cache:
+                cache[key] = CIProject.objects.get_or_create(name=ci_project)[0]
+            info['ci_project'] = cache[key]
         return info
 
+    def update_from_case_info(self, case_info):
+        """Create or update the case given the parsed case info.
+
+        :param case_info: case information dictionary as returned by `parse_case_info`
+        :type case_info: dict
+
+        :return: tuple of the case object and the created flag
+        """
+        case_info = dict(case_info)
+        case_id = case_info.pop('id')
+        tags = set(case_info.pop('tags'))
+        case, created = self.update_or_create(id=case_id, defaults=case_info)
+        if created or tags != set(case.tags.names()):
+            case.tags.set(*tags)
+        return case, created
+
+    def update_from_fogbugz_cases(self, cases, chunk_size=500, skip_unchanged=False):
+        """Create or update the cases given the already fetched Fogbugz case xml nodes.
+
+        Cases are upserted in chunks, each chunk in its own transaction and each case in its own savepoint, so the
+        case which fails to be upserted is logged and skipped without rolling back the rest of the chunk.
+
+        :param cases: list of beautifulsoup objects representing the case xml nodes
+        :param chunk_size: number of cases to upsert in a single transaction
+        :type chunk_size: int
+        :param skip_unchanged: skip the cases which modification date matches the stored one
+        :type skip_unchanged: bool
+
+        :return: number of cases created or updated
+        :rtype: int
+        """
+        cache = {}
+        count = 0
+        for start in range(0, len(cases), chunk_size):
+            chunk = cases[start:start + chunk_size]
+            modified_dates = dict(self.filter(
+                id__in=[int(case_xml.attrs['ixbug']) for case_xml in chunk]
+            ).values_list('id', 'modified_date')) if skip_unchanged else {}
+            with transaction.atomic():
+                for case_xml in chunk:
+                    try:
+                        case_info = self.parse_case_info(case_xml, cache=cache)
+                    except ValidationError:
+                        logger.warning('Failed to parse the case %s', case_xml.attrs.get('ixbug'), exc_info=True)
+                        continue
+                    if 'ci_project' not in case_info:
+                        # can be the case without CI project assigned
+                        continue
+                    if case_info['modified_date'] and modified_dates.get(case_info['id']) == case_info['modified_date']:
+                        continue
+                    try:
+                        with transaction.atomic():
+                            self.update_from_case_info(case_info)
+                    except (DatabaseError, ValidationError, ValueError):
+                        logger.warning('Failed to update the case %s', case_info['id'], exc_info=True)
+                        continue
+                    count += 1
+        return count
+
     def update_from_fogbugz(self, case_id):
         """Update the case from the Fogbugz API.
 
@@ -208,87 +297,85 @@ class CaseManager(models.Manager):
             case_info = self.get_case_info(case_id)
             tags = case_info.pop('tags')
             self.filter(id=case_id).update(**case_info)
+            touch_model_versions(Case)
             if tags:
                 case.refresh_from_db()
                 case.tags.set(*set(tags))
                 case.save()
 
-    def update_to_fogbugz_migration_url(self, case, fb, case_info, params):
+    def update_to_fogbugz_migration_url(self, case, case_info, params):
         """Update the case with migration url.
 
         :param case: case object
         :type case: core.models.Case
-        :param fb: fogbugz api client object
-        :param case_info: case information dictionary
+        :param case_info: case information dictionary, with the tags changed by the preceding edits
         :type case_info: dict
         :param params: optional case edit params
         :type params: dict
 
-        :return: fogbugz api response object
+        :return: fogbugz edit parameters, ``sTags`` being the set of the case tags
+        :rtype: dict
         """
-        response = fb.edit(
-            ixbug=case.id,
-            **{settings.FOGBUGZ_MIGRATION_URL_FIELD_ID: 'http://{0}{1}'.format(
+        return {
+            settings.FOGBUGZ_MIGRATION_URL_FIELD_ID: 'http://{0}{1}'.format(
                 settings.HOST_NAME,
                 reverse(
                     'admin:core_migration_change',
-                    args=(case.migration.id,)))})
-        return response
+                    args=(case.migration.id,)))}
 
-    def update_to_fogbugz_migration_reviewed(self, case, fb, case_info, params):
+    def update_to_fogbugz_migration_reviewed(self, case, case_info, params):
         """Update the case when migration is reviewed.
 
         :param case: case object
         :type case: core.models.Case
-        :param fb: fogbugz api client object
-        :param case_info: case information dictionary
+        :param case_info: case information dictionary, with the tags changed by the preceding edits
         :type case_info: dict
         :param params: optional case edit params
         :type params: dict
 
-        :return: fogbugz api response object
+        :return: fogbugz edit parameters, ``sTags`` being the set of the case tags
+        :rtype: dict
         """
         if 'migration-reviewed' not in case_info['tags']:
-            response = fb.edit(
-                ixbug=case.id,
+            return dict(
                 sEvent=__('Migration was marked as reviewed'),
-                sTags=','.join(case_info['tags'].union({'migration-reviewed'})))
-            return response
+                sTags=case_info['tags'].union({'migration-reviewed'}))
 
-    def update_to_fogbugz_migration_unreviewed(self, case, fb, case_info, params):
+    def update_to_fogbugz_migration_unreviewed(self, case, case_info, params):
         """Update the case when migration is unreviewed.
 
         :param case: case object
         :type case: core.models.Case
-        :param fb: fogbugz api client object
-        :param case_info: case information dictionary
+        :param case_info: case information dictionary, with the tags changed by the preceding edits
         :type case_info: dict
         :param params: optional case edit params
         :type params: dict
 
-        :return: fogbugz api response object
+        :return: fogbugz edit parameters, ``sTags`` being the set of the case tags
+        :rtype: dict
         """
         if 'migration-reviewed' in case_info['tags']:
-            response = fb.edit(
-                ixbug=case.id,
+            return dict(
                 sEvent=__('Migration was unmarked as reviewed'),
-                sTags=','.join(case_info['tags'].difference({'migration-reviewed'})))
-            return response
+                sTags=case_info['tags'].difference({'migration-reviewed'}))
 
-    def update_to_fogbugz_migration_report(self, case, fb, case_info, params):
+    def update_to_fogbugz_migration_report(self, case, case_info, params):
         """Update the case about the migration application.
 
         :param case: case object
         :type case: core.models.Case
-        :param fb: fogbugz api client object
-        :param case_info: case information dictionary
+        :param case_info: case information dictionary, with the tags changed by the preceding edits
         :type case_info: dict
         :param params: optional case edit params
         :type params: dict
 
-        :return: fogbugz api response object
+        :return: fogbugz edit parameters, ``sTags`` being the set of the case tags
+        :rtype: dict
         """
-        instance = Instance.objects.get(id=params['instance'])
+        instance = Instance.objects.filter(id=params['instance']).first()
+        if instance is None:
+            # the instance was deleted, the edit is dropped
+            return
         messages = {
             MigrationReport.STATUS_APPLIED: __(
                 'Migration was applied on {instance} successfully with log:\n{log}'
@@ -305,12 +392,14 @@ class CaseManager(models.Manager):
         except Migration.DoesNotExist:
             pass
         else:
-            report = MigrationReport.objects.get(instance=instance, migration=migration)
+            report = MigrationReport.objects.filter(instance=instance, migration=migration).first()
+            if report is None:
+                # the report was deleted, the edit is dropped
+                return
             kwargs = {}
             if report.status == MigrationReport.STATUS_APPLIED:
-                kwargs['sTags'] = ','.join(case_info['tags'].union({'migration-applied-{0}'.format(instance.name)}))
-            response = fb.edit(
-                ixbug=case.id,
+                kwargs['sTags'] = case_info['tags'].union({'migration-applied-{0}'.format(instance.name)})
+            return dict(
                 sEvent=messages[report.status].format(
                     instance=instance.name,
                     report_url='http://{0}{1}'.format(
@@ -318,25 +407,27 @@ class CaseManager(models.Manager):
                         reverse(
                             'admin:core_migrationreport_change',
                             args=(report.id,))),
-                    log=report.log),
+                    log=report.get_log()),
                 **kwargs
             )
-            return response
 
-    def update_to_fogbugz_deployment_report(self, case, fb, case_info, params):
+    def update_to_fogbugz_deployment_report(self, case, case_info, params):
         """Update the case about the deployment.
 
         :param case: case object
         :type case: core.models.Case
-        :param fb: fogbugz api client object
-        :param case_info: case information dictionary
+        :param case_info: case information dictionary, with the tags changed by the preceding edits
         :type case_info: dict
         :param params: optional case edit params
         :type params: dict
 
-        :return: fogbugz api response object
+        :return: fogbugz edit parameters, ``sTags`` being the set of the case tags
+        :rtype: dict
         """
-        report = DeploymentReport.objects.get(id=params['report'])
+        report = DeploymentReport.objects.filter(id=params['report']).first()
+        if report is None:
+            # the report was deleted, the edit is dropped
+            return
         messages = {
             DeploymentReport.STATUS_DEPLOYED: __(
                 'Deployed on {instance} successfully.\nSee the detailed deployment report here: {report_url}.'),
@@ -347,9 +438,8 @@ class CaseManager(models.Manager):
         tags = {'deployed-{0}'.format(report.instance.name)}
         if not tags.issubset(case_info['tags']) and report.cases.filter(id=case.id).count():
             if report.status == DeploymentReport.STATUS_DEPLOYED:
-                kwargs['sTags'] = ','.join(case_info['tags'].union(tags))
-            response = fb.edit(
-                ixbug=case.id,
+                kwargs['sTags'] = case_info['tags'].union(tags)
+            return dict(
                 sEvent=messages[report.status].format(
                     instance=report.instance.name,
                     report_url='http://{0}{1}'.format(
@@ -357,28 +447,26 @@ class CaseManager(models.Manager):
                         reverse(
                             'admin:core_deploymentreport_change',
                             args=(report.id,))),
-                    log=report.log),
+                    log=report.get_log()),
                 **kwargs
             )
-            return response
 
-    @transaction.atomic
-    def update_to_fogbugz(self, case_id):
-        """Update the case via the Fogbugz API.
+    def merge_fogbugz_edits(self, case, case_info, edits):
+        """Merge the pending case edits into the single Fogbugz edit.
 
-        :param id: Fogbugz case id
-        """
-        case = self.get(id=case_id)
-        fb = fogbugz.FogBugz(
-            settings.AUTH_FOGBUGZ_SERVER,
-            settings.FOGBUGZ_TOKEN)
+        Edits are applied in order: every edit sees the tags changed by the preceding ones, events are
+        concatenated and the later custom field values win.
 
-        case_info = self.get_case_info(case_id, fb=fb)
-        try:
-            edits = case.edits.select_for_update()
-        except DatabaseError:
-            # concurrent update is running
-            return
+        :param case: case object
+        :type case: core.models.Case
+        :param case_info: case information dictionary
+        :type case_info: dict
+        :param edits: case edits
+        :type edits: list
+
+        :return: fogbugz edit parameters, empty if there's nothing to change
+        :rtype: dict
+        """
         handlers = {
             CaseEdit.TYPE_MIGRATION_URL: self.update_to_fogbugz_migration_url,
             CaseEdit.TYPE_MIGRATION_REVIEWED: self.update_to_fogbugz_migration_reviewed,
@@ -386,14 +474,129 @@ class CaseManager(models.Manager):
             CaseEdit.TYPE_MIGRATION_REPORT: self.update_to_fogbugz_migration_report,
             CaseEdit.TYPE_DEPLOYMENT_REPORT: self.update_to_fogbugz_deployment_report,
         }
+        tags = frozenset(case_info['tags'])
+        events = []
+        kwargs = {}
         for edit in edits:
-            response = None
             handler = handlers.get(edit.type)
-            if handler:
-                response = handler(case, fb, case_info, edit.params)
-            if response and not response.case:
+            changes = handler(case, dict(case_info, tags=tags), edit.params) if handler else None
+            if changes:
+                tags = frozenset(changes.pop('sTags', tags))
+                if 'sEvent' in changes:
+                    events.append(changes.pop('sEvent'))
+                kwargs.update(changes)
+        if tags != case_info['tags']:
+            kwargs['sTags'] = ','.join(sorted(tags))
+        if events:
+            kwargs['sEvent'] = '\n\n'.join(events)
+        return kwargs
+
+    def update_from_fogbugz_edit(self, case, response):
+        """Update the local case mirror given the Fogbugz edit response.
+
+        :param case: case object
+        :type case: core.models.Case
+        :param response: fogbugz edit api response object
+        """
+        case_xml = response.case
+        self.filter(id=case.id).update(
+            modified_date=parse_datetime(case_xml.dtlastupdated.string),
+            latest_event_id=int(case_xml.ixbugeventlatest.string))
+        case.tags.set(*(tag.string.strip() for tag in case_xml.tags.findAll('tag')))
+
+    def push_fogbugz_edits(self, fb, case, case_info, edits, **kwargs):
+        """Push the case edits merged into the single Fogbugz edit.
+
+        :param fb: fogbugz client instance
+        :param case: case object
+        :type case: core.models.Case
+        :param case_info: case information dictionary
+        :type case_info: dict
+        :param edits: case edits
+        :type edits: list
+        :param kwargs: additional fogbugz edit parameters
+        """
+        changes = self.merge_fogbugz_edits(case, case_info, edits)
+        if changes:
+            response = fb.edit(ixbug=case.id, cols=self.edit_columns, **dict(kwargs, **changes))
+            if not response.case:
                 raise RuntimeError(response)
-            edit.delete()
+            self.update_from_fogbugz_edit(case, response)
+
+    @transaction.atomic
+    def update_to_fogbugz(self, case_id):
+        """Update the case via the Fogbugz API.
+
+        All the pending case edits are pushed with a single Fogbugz edit.
+        When the case has the latest Fogbugz event mirrored, the local tags are trusted and the edit is made
+        conditional on that event, so the case is only re-read from Fogbugz if it was changed in the meantime.
+
+        :param id: Fogbugz case id
+        """
+        case = self.get(id=case_id)
+        try:
+            edits = list(case.edits.select_for_update())
+        except DatabaseError:
+            # concurrent update is running
+            return
+        if not edits:
+            # nothing to push
+            return
+        with fogbugz_pool.client() as fb:
+            pushed = False
+            if settings.FOGBUGZ_TRUST_LOCAL_CASE_INFO and case.latest_event_id:
+                case_info = dict(tags=frozenset(case.tags.names()), modified_date=case.modified_date)
+                try:
+                    self.push_fogbugz_edits(fb, case, case_info, edits, ixBugEventLatest=case.latest_event_id)
+                    pushed = True
+                except fogbugz.FogBugzConnectionError:
+                    raise
+                except fogbugz.FogBugzAPIError:
+                    logger.info('Case %s was changed in Fogbugz since the last sync, re-reading it', case.id)
+            if not pushed:
+                self.push_fogbugz_edits(fb, case, self.get_case_info(case_id, fb=fb), edits)
+        CaseEdit.objects.filter(id__in=[edit.id for edit in edits]).delete()
+
+    def get_or_create_many_from_fogbugz(self, case_ids, fetch_limit=None):
+        """Get the cases, creating the missing ones from a single Fogbugz search.
+
+        Cases which are not found in Fogbugz or can not be parsed are skipped.
+
+        :param case_ids: Fogbugz case ids
+        :param fetch_limit: maximum number of the missing cases to fetch, nothing is fetched if it's exceeded
+        :type fetch_limit: int
+
+        :return: tuple of the list of the cases and the set of the missing case ids which were not fetched
+        """
+        case_ids = frozenset(case_ids)
+        cases = list(self.filter(id__in=case_ids))
+        missing = case_ids.difference(case.id for case in cases)
+        if not missing or (fetch_limit is not None and len(missing) > fetch_limit):
+            return cases, missing
+        try:
+            with fogbugz_pool.client() as fb:
+                resp = fb.search(
+                    q=','.join(str(case_id) for case_id in sorted(missing)),
+                    cols=self.case_info_columns,
+                    max=len(missing),
+                )
+        except fogbugz.FogBugzConnectionError:
+            logger.warning('Failed to fetch the cases %s', sorted(missing), exc_info=True)
+            return cases, missing
+        cache = {}
+        for case_xml in resp.findAll('case'):
+            try:
+                case_info = self.parse_case_info(case_xml, cache=cache)
+            except ValidationError:
+                logger.warning('Failed to parse the case %s', case_xml.attrs.get('ixbug'), exc_info=True)
+                continue
+            if case_info['id'] not in missing or 'ci_project' not in case_info:
+                continue
+            cases.append(self.update_from_case_info(case_info)[0])
+        not_found = missing.difference(case.id for case in cases)
+        if not_found:
+            logger.warning('Cases %s were not found in Fogbugz', sorted(not_found))
+        return cases, frozenset()
 
     def get_or_create_from_fogbugz(self, case_id):
         """Get or create an object from the Fogbugz API.
@@ -427,6 +630,9 @@ class Case(models.Model):
     modified_date = models.DateTimeField(default=timezone.now)
     tags = TaggableManager(blank=True)
     revision = models.CharField(max_length=255, blank=True, db_index=True)
+    latest_event_id = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        help_text=_('Latest Fogbugz case event, the case edits are only pushed if there are no newer events.'))
 
     class Meta:
         verbose_name = _("Case")
@@ -459,8 +665,11 @@ class CaseEdit(models.Model):
     class Meta:
         verbose_name = _("Case edit")
         verbose_name_plural = _("Case edits")
+        index_together = (("datetime", "case"),)
+        ordering = ['datetime', 'id']
 
     case = models.ForeignKey(Case, related_name='edits')
+    datetime = models.DateTimeField(default=timezone.now, db_index=True)
 
     TYPE_MIGRATION_URL = 'migration-url'
     TYPE_MIGRATION_REVIEWED = 'migration-reviewed'
@@ -508,23 +717,137 @@ class CaseCategory(models.Model):
         super(CaseCategory, self).save(*args, **kwargs)
 
 
+class MigrationSortError(ValueError):
+
+    """Migrations can not be sorted in a topological order."""
+
+    def __init__(self, errors):
+        """Initialize new instance.
+
+        :param errors: dictionary of the migration uid and the reason it can not be sorted
+        :type errors: dict
+        """
+        self.errors = errors
+        super(MigrationSortError, self).__init__('; '.join(errors[uid] for uid in sorted(errors)))
+
+
 class MigrationManager(models.Manager):
 
     """Migration manager to allow topological migration sorting."""
 
-    def sort(self, queryset):
+    @staticmethod
+    def get_ordering_cache_key(ci_project_id):
+        """Get the cache key of the CI project migration ordering."""
+        return 'pdt:migration-ordering:{0}'.format(ci_project_id)
+
+    @staticmethod
+    def get_parent_errors(parents):
+        """Get the migrations which parent can not be sorted before them.
+
+        :param parents: dictionary of the migration uid and its parent uid
+        :type parents: dict
+
+        :return: dictionary of the migration uid and the reason it can not be sorted
+        :rtype: dict
+        """
+        errors = {}
+        for uid, parent_uid in parents.items():
+            if parent_uid == uid:
+                errors[uid] = 'Migration {0} depends on itself'.format(uid)
+            elif parent_uid and parent_uid not in parents:
+                errors[uid] = 'Parent migration {0} of migration {1} is not in the CI project'.format(parent_uid, uid)
+        return errors
+
+    def get_ordering(self, ci_project_id, refresh=False):
+        """Get the topological ordering of the CI project migrations.
+
+        The ordering is cached until the migrations are changed. Migrations which parent chain leaves the CI project
+        or has a cycle are left out of the ordering, so they only fail the sorting of the migrations depending on them.
+
+        :param ci_project_id: CI project id
+        :type ci_project_id: int
+        :param refresh: calculate the ordering even if it's cached
+        :type refresh: bool
+
+        :return: tuple of the dictionary of the migration uid and its position and the dictionary of the migration uid
+            and the reason it can not be sorted
+        :rtype: tuple
+        """
+        key = self.get_ordering_cache_key(ci_project_id)
+        result = None if refresh else cache.get(key)
+        if result is None:
+            parents = dict(self.filter(case__ci_project=ci_project_id).values_list('uid', 'parent__uid'))
+            errors = self.get_parent_errors(parents)
+            uids = []
+            try:
+                for level in toposort({
+                        uid: {parent_uid} if parent_uid in parents else set()
+                        for uid, parent_uid in parents.items()}):
+                    uids.extend(sorted(level))
+            except ValueError:
+                # the rest of the migrations are in a cycle or depend on it
+                errors.update(
+                    (uid, 'Migration {0} depends on a dependency cycle'.format(uid))
+                    for uid in set(parents).difference(uids))
+            for uid in uids:
+                # parents are sorted first, so the errors are propagated down the whole chain
+                if parents[uid] in errors:
+                    errors.setdefault(uid, errors[parents[uid]])
+            result = {uid: position for position, uid in enumerate(uids) if uid not in errors}, errors
+            cache.set(key, result, settings.MIGRATION_ORDERING_CACHE_TIMEOUT)
+        return result
+
+    def sort_uids(self, queryset):
+        """Sort uids of the given queryset in a topological order.
+
+        Parent migrations which are not in the queryset are included.
+
+        :param queryset: django queryset
+        :return: sorted list of the migration uids
+        :raises MigrationSortError: if the parent chain of the migrations leaves the CI project or has a cycle
+        """
+        rows = list(queryset.values_list('uid', 'parent__uid', 'case__ci_project'))
+        uids = {uid: ci_project_id for uid, _, ci_project_id in rows}
+        uids.update(
+            (parent_uid, ci_project_id) for _, parent_uid, ci_project_id in rows
+            if parent_uid and parent_uid not in uids)
+        orderings = {}
+        errors = {}
+        for ci_project_id in set(uids.values()):
+            ordering, ci_project_errors = self.get_ordering(ci_project_id)
+            if not all(
+                    uid in ci_project_errors or (uid in ordering and (
+                        not parent_uid or ordering.get(parent_uid, len(ordering)) < ordering[uid]))
+                    for uid, parent_uid, row_ci_project_id in rows if row_ci_project_id == ci_project_id):
+                # cached ordering is stale
+                ordering, ci_project_errors = self.get_ordering(ci_project_id, refresh=True)
+            orderings[ci_project_id] = ordering
+            errors.update(
+                (uid, ci_project_errors[uid]) for uid, uid_ci_project_id in uids.items()
+                if uid_ci_project_id == ci_project_id and uid in ci_project_errors)
+        if errors:
+            raise MigrationSortError(errors)
+        return sorted(uids, key=lambda uid: (orderings[uids[uid]].get(uid, -1), uid))
+
+    def sort(self, queryset, parents_queryset=None):
         """Sort given the queryset in a topological order.
 
+        Parent migrations which are not in the queryset are included.
+
         :param queryset: django queryset
+        :param parents_queryset: queryset to get the parent migrations which are not in the queryset
         :return: sorted list of `Migration` objects
+        :raises MigrationSortError: if the parent migration belongs to another CI project or there's a cycle
         """
-        first_migration = queryset.first()
-        uids = {migration.uid: migration for migration in (self.filter(
-            case__ci_project=first_migration.case.ci_project,
-        ) if first_migration else self.all())}
-        mapping = {
-            migration.uid: {migration.parent.uid} if migration.parent else set() for migration in queryset}
-        return [uids[uid] for uid in toposort_flatten(mapping)]
+        uids = self.sort_uids(queryset)
+        migrations = {migration.uid: migration for migration in queryset}
+        missing = set(uids).difference(migrations)
+        if missing:
+            migrations.update(
+                (migration.uid, migration)
+                for migration in (self.all() if parents_queryset is None else parents_queryset).filter(
+                    uid__in=missing))
+        return [migrations[uid] for uid in uids]
 
 
 class Migration(models.Model):
@@ -541,6 +864,7 @@ class Migration(models.Model):
     case = models.OneToOneField(Case, unique=True)
     category = models.CharField(max_length=3, choices=CATEGORY_CHOICES, default='onl', db_index=True)
     reviewed = models.BooleanField(default=False, db_index=True)
+    digest = models.CharField(max_length=40, blank=True, editable=False)
 
     tracker = FieldTracker()
 
@@ -561,8 +885,52 @@ class Migration(models.Model):
         return '{self.case}: {self.category}: {self.uid}'.format(self=self)
 
     def get_steps(self):
-        """Get all migration steps."""
-        return chain(self.pre_deploy_steps.all(), self.post_deploy_steps.all(), self.final_steps.all())
+        """Get all migration steps in the order of the phases."""
+        return self.steps.all()
+
+    def get_phase_steps(self, phase):
+        """Get the migration steps of the phase.
+
+        The prefetched steps are used if there are any, otherwise the steps are queried.
+
+        :param phase: migration step phase
+        :type phase: int
+        """
+        if 'steps' in getattr(self, '_prefetched_objects_cache', {}):
+            return [step for step in self.steps.all() if step.phase == phase]
+        return self.steps.filter(phase=phase)
+
+    @property
+    def pre_deploy_steps(self):
+        """Pre-deploy phase migration steps."""
+        return self.get_phase_steps(MigrationStep.PHASE_PRE_DEPLOY)
+
+    @property
+    def post_deploy_steps(self):
+        """Post-deploy phase migration steps."""
+        return self.get_phase_steps(MigrationStep.PHASE_POST_DEPLOY)
+
+    @property
+    def final_steps(self):
+        """Final phase migration steps."""
+        return self.get_phase_steps(MigrationStep.PHASE_FINAL)
+
+    @staticmethod
+    def get_digest(uid, parent_uid, case_id, steps):
+        """Get the digest of the migration content.
+
+        :param uid: migration uid
+        :param parent_uid: parent migration uid
+        :param case_id: case id
+        :param steps: lists of the step field values of the pre-deploy, post-deploy and final phases
+        :type steps: list
+
+        :return: hex digest of the migration and its steps
+        :rtype: str
+        """
+        return hashlib.sha1(json.dumps([
+            uid, parent_uid, case_id, [[MigrationStep.get_digest(values) for values in phase] for phase in steps],
+        ]).encode('utf-8')).hexdigest()
 
 
 def migration_changes(sender, instance, **kwargs):
@@ -581,6 +949,77 @@ def migration_changes(sender, instance, **kwargs):
 post_save.connect(migration_changes, sender=Migration)
 
 
+def migration_digest_changes(sender, instance, **kwargs):
+    """Reset the migration digest when the migration or its steps are changed outside of the API upload."""
+    migration_id = instance.migration_id if isinstance(instance, MigrationStep) else instance.id
+    Migration.objects.filter(id=migration_id).exclude(digest='').update(digest='')
+
+
+post_save.connect(migration_digest_changes, sender=Migration)
+
+
+def migration_ordering_changes(sender, instance, **kwargs):
+    """Invalidate the cached migration ordering of the CI project."""
+    ci_project_id = Case.objects.filter(id=instance.case_id).values_list('ci_project', flat=True).first()
+    cache.delete(Migration.objects.get_ordering_cache_key(ci_project_id))
+
+
+post_save.connect(migration_ordering_changes, sender=Migration)
+post_delete.connect(migration_ordering_changes, sender=Migration)
+
+
+class MigrationClosure(models.Model):
+
+    """Ancestor and descendant pair of the migration dependency graph.
+
+    Every migration is its own ancestor with zero depth, the parent has the depth of 1.
+    """
+
+    class Meta:
+        verbose_name = _("Migration closure")
+        verbose_name_plural = _("Migration closures")
+        unique_together = (("ancestor", "descendant"),)
+        index_together = (("descendant", "depth"),)
+
+    ancestor = models.ForeignKey(Migration, related_name='descendant_links')
+    descendant = models.ForeignKey(Migration, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    def __str__(self):
+        """String representation."""
+        return '{self.ancestor_id}: {self.descendant_id}: {self.depth}'.format(self=self)
+
+
+def migration_closure_changes(sender, instance, **kwargs):
+    """Maintain the migration closure when the migration is created or its parent is changed."""
+    links = MigrationClosure.objects
+    subtree = dict(links.filter(ancestor=instance).values_list('descendant', 'depth'))
+    if not subtree:
+        links.create(ancestor=instance, descendant=instance, depth=0)
+        subtree = {instance.id: 0}
+    elif links.filter(descendant=instance, depth=1).values_list('ancestor', flat=True).first() == instance.parent_id:
+        return
+    ancestors = []
+    if instance.parent_id is not None:
+        # the ancestors of the new parent are outside of the subtree unless it's a cycle
+        ancestors = list(links.filter(descendant=instance.parent_id).values_list('ancestor', 'depth'))
+        if any(ancestor_id in subtree for ancestor_id, _ in ancestors):
+            # the closure of the former parent is kept
+            logger.error('Migration %s can not depend on its descendant %s', instance.uid, instance.parent_id)
+            return
+    with transaction.atomic():
+        # detach the subtree from the former ancestors
+        links.filter(descendant__in=subtree).exclude(ancestor__in=subtree).delete()
+        links.bulk_create(
+            MigrationClosure(
+                ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + descendant_depth + 1)
+            for ancestor_id, ancestor_depth in ancestors
+            for descendant_id, descendant_depth in subtree.items())
+
+
+post_save.connect(migration_closure_changes, sender=Migration)
+
+
 class MigrationStep(models.Model):
 
     """Migration step."""
@@ -588,8 +1027,8 @@ class MigrationStep(models.Model):
     class Meta:
         verbose_name = _("Migration step")
         verbose_name_plural = _("Migration steps")
-        index_together = (("id", "position"),)
-        ordering = ['position']
+        index_together = (("id", "position"), ("migration", "phase", "position"))
+        ordering = ['phase', 'position']
 
     TYPE_CHOICES = (
         ('mysql', _('MySQL')),
@@ -598,16 +1037,59 @@ class MigrationStep(models.Model):
         ('sh', _('Shell')),
     )
 
+    PHASE_PRE_DEPLOY = 1
+    PHASE_POST_DEPLOY = 2
+    PHASE_FINAL = 3
+
+    PHASE_CHOICES = (
+        (PHASE_PRE_DEPLOY, _('Pre-deploy')),
+        (PHASE_POST_DEPLOY, _('Post-deploy')),
+        (PHASE_FINAL, _('Final')),
+    )
+
+    # migration accessors of the phase steps
+    PHASE_ACCESSORS = (
+        ('pre_deploy_steps', PHASE_PRE_DEPLOY),
+        ('post_deploy_steps', PHASE_POST_DEPLOY),
+        ('final_steps', PHASE_FINAL),
+    )
+
+    DIGEST_FIELDS = ('type', 'code', 'path', 'position')
+
+    # phase of the phase step proxy models
+    PHASE = None
+
+    migration = models.ForeignKey(Migration, related_name='steps')
+    phase = models.PositiveSmallIntegerField(choices=PHASE_CHOICES)
     type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     code = models.TextField()
     path = models.CharField(max_length=255, blank=True, null=True)
     position = models.PositiveSmallIntegerField(db_index=True)
 
+    @classmethod
+    def get_digest(cls, values):
+        """Get the digest of the step content.
+
+        :param values: step field values
+        :type values: dict
+
+        :return: hex digest of the type, code, path and position
+        :rtype: str
+        """
+        return hashlib.sha1(
+            json.dumps([values.get(name) for name in cls.DIGEST_FIELDS]).encode('utf-8')).hexdigest()
+
     def clean(self):
         """Require path for non-sql type."""
         if 'sql' not in self.type and not self.path:
             raise ValidationError('Path is required for non-sql migration step type.')
 
+    def save(self, *args, **kwargs):
+        """Set the phase of the phase step."""
+        if self.PHASE is not None:
+            self.phase = self.PHASE
+        super(MigrationStep, self).save(*args, **kwargs)
+
     @staticmethod
     def autocomplete_search_fields():
         """Auto complete search fields."""
@@ -618,37 +1100,164 @@ class MigrationStep(models.Model):
         return 'Migration step {self.id}: {self.type}'.format(self=self)  # pylint: disable=W1306
 
 
+class PhaseMigrationStepManager(models.Manager):
+
+    """Manager of the migration steps of the phase."""
+
+    def get_queryset(self):
+        """Limit the steps to the phase of the model."""
+        return super(PhaseMigrationStepManager, self).get_queryset().filter(phase=self.model.PHASE)
+
+
 class PreDeployMigrationStep(MigrationStep):
 
     """Pre-deploy phase migration step."""
 
+    PHASE = MigrationStep.PHASE_PRE_DEPLOY
+
+    objects = PhaseMigrationStepManager()
+
     class Meta:
+        proxy = True
         verbose_name = _("Pre-deploy migration step")
         verbose_name_plural = _("Pre-deploy migration steps")
 
-    migration = models.ForeignKey(Migration, related_name="pre_deploy_steps")
-
 
 class PostDeployMigrationStep(MigrationStep):
 
     """Post-deploy phase migration step."""
 
+    PHASE = MigrationStep.PHASE_POST_DEPLOY
+
+    objects = PhaseMigrationStepManager()
+
     class Meta:
+        proxy = True
         verbose_name = _("Post-deploy migration step")
         verbose_name_plural = _("Post-deploy migration steps")
 
-    migration = models.ForeignKey(Migration, related_name="post_deploy_steps")
-
 
 class FinalMigrationStep(MigrationStep):
 
     """Final phase migration step."""
 
+    PHASE = MigrationStep.PHASE_FINAL
+
+    objects = PhaseMigrationStepManager()
+
     class Meta:
+        proxy = True
         verbose_name = _("Final migration step")
         verbose_name_plural = _("Final migration steps")
 
-    migration = models.ForeignKey(Migration, related_name="final_steps")
+
+post_save.connect(migration_digest_changes, sender=MigrationStep)
+post_save.connect(migration_digest_changes, sender=PreDeployMigrationStep)
+post_save.connect(migration_digest_changes, sender=PostDeployMigrationStep)
+post_save.connect(migration_digest_changes, sender=FinalMigrationStep)
+post_delete.connect(migration_digest_changes, sender=MigrationStep)
+post_delete.connect(migration_digest_changes, sender=PreDeployMigrationStep)
+post_delete.connect(migration_digest_changes, sender=PostDeployMigrationStep)
+post_delete.connect(migration_digest_changes, sender=FinalMigrationStep)
+
+
+class LogOffsetError(ValueError):
+
+    """Log chunk offset does not match the log length."""
+
+    def __init__(self, length):
+        """Initialize new instance.
+
+        :param length: current log length
+        :type length: int
+        """
+        super(LogOffsetError, self).__init__('Log chunk offset should be {0}'.format(length))
+        self.length = length
+
+
+class LogChunk(models.Model):
+
+    """Log chunk appended to the report log."""
+
+    class Meta:
+        abstract = True
+        ordering = ['report', 'offset']
+
+    offset = models.PositiveIntegerField()
+    log = models.TextField()
+    datetime = models.DateTimeField(default=timezone.now)
+
+
+class ChunkedLogMixin(object):
+
+    """Report log which can be appended in chunks without rewriting the report row.
+
+    The log chunks are stored in the ``log_chunks`` related model and follow the ``log`` field.
+    """
+
+    def get_log_length(self):
+        """Get the log length including the appended chunks."""
+        last_chunk = self.log_chunks.order_by('-offset').only('offset', 'log').first()
+        return last_chunk.offset + len(last_chunk.log) if last_chunk else len(self.log)
+
+    def iter_log(self, offset=0, limit=None):
+        """Iterate over the log parts.
+
+        :param offset: offset of the first log character
+        :type offset: int
+        :param limit: maximum number of the log characters
+        :type limit: int
+        """
+        start = self.log_chunks.filter(offset__lte=offset).aggregate(start=models.Max('offset'))['start']
+        chunks = self.log_chunks.order_by('offset').values_list('offset', 'log')
+        if start is None:
+            parts = chain(((0, self.log),), chunks.iterator())
+        else:
+            parts = chunks.filter(offset__gte=start).iterator()
+        end = None if limit is None else offset + limit
+        for part_offset, part in parts:
+            if end is not None and part_offset >= end:
+                break
+            if part_offset + len(part) > offset:
+                yield part[max(offset - part_offset, 0):None if end is None else end - part_offset]
+
+    def get_log(self, offset=0, limit=None):
+        """Get the log including the appended chunks.
+
+        :param offset: offset of the first log character
+        :type offset: int
+        :param limit: maximum number of the log characters
+        :type limit: int
+        """
+        if not offset and limit is None:
+            # prefetched chunks are reused
+            return self.log + ''.join(chunk.log for chunk in self.log_chunks.all())
+        return ''.join(self.iter_log(offset, limit))
+
+    def append_log(self, offset, log):
+        """Append the log chunk.
+
+        The chunk which was already appended is ignored, so that the upload can be retried.
+
+        :param offset: log length the chunk is appended at
+        :type offset: int
+        :param log: log chunk
+        :type log: str
+
+        :return: log length after the chunk is appended
+        :rtype: int
+        :raises LogOffsetError: if the offset does not match the log length
+        """
+        with transaction.atomic():
+            # lock the report so that the concurrent chunks are appended in order
+            type(self).objects.select_for_update().only('id').get(id=self.id)
+            length = self.get_log_length()
+            if offset == length:
+                self.log_chunks.create(offset=offset, log=log)
+                return length + len(log)
+            if offset < length and self.get_log(offset, len(log)) == log:
+                return length
+            raise LogOffsetError(length)
 
 
 class MigrationReport(models.Model):
@@ -676,7 +1285,8 @@ class MigrationReport(models.Model):
     instance = models.ForeignKey(Instance, related_name='migration_reports')
     status = models.CharField(max_length=3, choices=STATUS_CHOICES)
     datetime = models.DateTimeField(db_index=True, auto_now=True)
-    log = models.TextField(blank=True)
+    log = CompressedTextField(blank=True)
+    is_calculated = models.BooleanField(default=True, db_index=True, editable=False)
 
     tracker = FieldTracker()
 
@@ -690,37 +1300,80 @@ class MigrationReport(models.Model):
         """Auto complete search fields."""
         return ("id__iexact", "migration__uid__icontains", "migration__case__id__icontains")
 
-    def calculate_status(self):
+    def calculate_status(self, save=True):
         """Calculate report status based on step reports."""
-        migration_steps = frozenset(step.id for step in self.migration.get_steps())
+        migration_steps = frozenset(self.migration.steps.values_list('id', flat=True))
+        step_statuses = list(self.step_reports.values_list('step', 'status'))
         apl_report_steps = frozenset(
-            report.step.id for report in self.step_reports.all() if report.status == self.STATUS_APPLIED)
+            step_id for step_id, status in step_statuses if status == self.STATUS_APPLIED)
         err_report_steps = frozenset(
-            report.step.id for report in self.step_reports.all() if report.status != self.STATUS_APPLIED)
+            step_id for step_id, status in step_statuses if status != self.STATUS_APPLIED)
         if apl_report_steps == migration_steps:
             self.status = self.STATUS_APPLIED
         elif err_report_steps and apl_report_steps:
             self.status = self.STATUS_APPLIED_PARTIALLY
         else:
             self.status = self.STATUS_ERROR
-        self.save()
+        if save:
+            self.save()
+
+    def iter_log(self):
+        """Iterate over the report log chunks.
 
-    def calculate_log(self):
-        """Calculate report log based on step reports."""
-        self.log = "\n\n".join(
-            "{YELLOW}-- Applying migration step: id={report.step.id}, position={report.step.position}\n"
-            "{RESET}{report.log}".format(
-                report=report,
-                YELLOW=Fore.YELLOW,
-                RESET=Fore.RESET)
-            for report in self.step_reports.all())
-        self.save()
+        The log is streamed from the step reports if there are any, otherwise the stored log is used.
+        """
+        if settings.MIGRATION_REPORT_STORE_LOG and self.is_calculated and self.log:
+            yield self.log
+            return
+        if 'step_reports' in getattr(self, '_prefetched_objects_cache', {}):
+            step_reports = self.step_reports.all()
+        else:
+            step_reports = self.step_reports.select_related('step').prefetch_related('log_chunks').only(
+                'log', 'step', 'step__id', 'step__position')
+        first = True
+        for report in step_reports:
+            if not first:
+                yield "\n\n"
+            first = False
+            yield "{YELLOW}-- Applying migration step: id={report.step.id}, position={report.step.position}\n" \
+                "{RESET}{log}".format(
+                    report=report,
+                    log=report.get_log(),
+                    YELLOW=Fore.YELLOW,
+                    RESET=Fore.RESET)
+        if first:
+            yield self.log
+
+    def get_log(self):
+        """Get the report log, assembled from the step reports if there are any."""
+        return "".join(self.iter_log())
+
+    def calculate_log(self, save=True):
+        """Calculate report log based on step reports.
+
+        If storing the log is disabled, the log is only assembled on read.
+        """
+        if self.step_reports.exists():
+            self.is_calculated = False
+            self.log = self.get_log() if settings.MIGRATION_REPORT_STORE_LOG else ''
+            self.is_calculated = True
+        if save:
+            self.save()
+
+    def calculate(self):
+        """Calculate report status and log based on step reports, saving the report once."""
+        self.calculate_status(save=False)
+        self.calculate_log(save=False)
+        # the calculation flag is maintained by the step report changes
+        self.save(update_fields=('status', 'log', 'datetime'))
 
 
 def migration_report_changes(sender, instance, **kwargs):
     """Send case updates about migration application status."""
     changed = instance.tracker.changed()
-    if instance.log != changed.get('log', instance.log):
+    # without the stored log, the calculation based on the step reports is the log change
+    calculated = not settings.MIGRATION_REPORT_STORE_LOG and 'log' in (kwargs.get('update_fields') or ())
+    if calculated or instance.log != changed.get('log', instance.log):
         params = dict(instance=instance.instance.id)
         CaseEdit.objects.get_or_create(
             case=instance.migration.case, type=CaseEdit.TYPE_MIGRATION_REPORT, params=params)
@@ -731,7 +1384,46 @@ def migration_report_changes(sender, instance, **kwargs):
 post_save.connect(migration_report_changes, sender=MigrationReport)
 
 
-class MigrationStepReport(models.Model):
+class MigrationStatus(models.Model):
+
+    """Status of the migration on the instance.
+
+    Denormalized status matrix of the migration reports without the logs, maintained on the report changes.
+    """
+
+    class Meta:
+        verbose_name = _("Migration status")
+        verbose_name_plural = _("Migration statuses")
+        unique_together = (("migration", "instance"),)
+        index_together = (("instance", "migration"),)
+
+    migration = models.ForeignKey(Migration, related_name='statuses')
+    instance = models.ForeignKey(Instance, related_name='migration_statuses')
+    status = models.CharField(max_length=3, choices=MigrationReport.STATUS_CHOICES)
+    datetime = models.DateTimeField()
+
+    def __str__(self):
+        """String representation."""
+        return '{self.migration_id}: {self.instance_id}: {self.status}'.format(self=self)
+
+
+def migration_status_changes(sender, instance, **kwargs):
+    """Update the migration status matrix on the migration report change."""
+    MigrationStatus.objects.update_or_create(
+        migration_id=instance.migration_id, instance_id=instance.instance_id,
+        defaults=dict(status=instance.status, datetime=instance.datetime))
+
+
+def migration_status_deletes(sender, instance, **kwargs):
+    """Remove the migration status from the matrix on the migration report deletion."""
+    MigrationStatus.objects.filter(migration=instance.migration_id, instance=instance.instance_id).delete()
+
+
+post_save.connect(migration_status_changes, sender=MigrationReport)
+post_delete.connect(migration_status_deletes, sender=MigrationReport)
+
+
+class MigrationStepReport(ChunkedLogMixin, models.Model):
 
     """Migration step report."""
 
@@ -754,7 +1446,7 @@ class MigrationStepReport(models.Model):
     step = models.ForeignKey(MigrationStep, related_name='reports')
     status = models.CharField(max_length=3, choices=STATUS_CHOICES, db_index=True)
     datetime = models.DateTimeField(default=timezone.now, db_index=True)
-    log = models.TextField(blank=True)
+    log = CompressedTextField(blank=True)
 
     def __str__(self):
         """String representation."""
@@ -763,15 +1455,41 @@ class MigrationStepReport(models.Model):
 
 
 def migration_step_report_changes(sender, instance, **kwargs):
-    """Calculate migration report status."""
-    instance.report.calculate_status()
-    instance.report.calculate_log()
+    """Schedule migration report calculation.
+
+    The report is marked as not calculated and the calculation is delayed, so that the step reports of the same
+    migration application are coalesced into a single calculation.
+    """
+    MigrationReport.objects.filter(id=instance.report_id).update(is_calculated=False)
+    from .tasks import calculate_migration_report
+    calculate_migration_report.apply_async(
+        kwargs=dict(report_id=instance.report_id), countdown=settings.MIGRATION_REPORT_CALCULATION_DELAY)
 
 
 post_save.connect(migration_step_report_changes, sender=MigrationStepReport)
 
 
-class DeploymentReport(models.Model):
+class MigrationStepReportLogChunk(LogChunk):
+
+    """Migration step report log chunk."""
+
+    class Meta(LogChunk.Meta):
+        verbose_name = _("Migration step report log chunk")
+        verbose_name_plural = _("Migration step report log chunks")
+        unique_together = (("report", "offset"),)
+
+    report = models.ForeignKey(MigrationStepReport, related_name='log_chunks')
+
+
+def migration_step_report_log_changes(sender, instance, **kwargs):
+    """Schedule migration report calculation when the step report log is appended."""
+    migration_step_report_changes(sender, instance.report, **kwargs)
+
+
+post_save.connect(migration_step_report_log_changes, sender=MigrationStepReportLogChunk)
+
+
+class DeploymentReport(ChunkedLogMixin, models.Model):
 
     """Deployment report."""
 
@@ -792,7 +1510,7 @@ class DeploymentReport(models.Model):
     instance = models.ForeignKey(Instance, related_name='deployment_reports')
     status = models.CharField(max_length=3, choices=STATUS_CHOICES)
     datetime = models.DateTimeField(default=timezone.now)
-    log = models.TextField(blank=True)
+    log = CompressedTextField(blank=True)
     cases = models.ManyToManyField(Case, related_name='deployment_reports')
 
     tracker = FieldTracker()
@@ -802,17 +1520,198 @@ class DeploymentReport(models.Model):
         return '{id}: {self.instance}: {self.datetime}: {status}'.format(
             id=self.id, self=self, status=self.get_status_display())
 
+    def notify(self, cases=None):
+        """Send case updates about the deployment status.
+
+        :param cases: cases to update, all the report cases if not given
+        """
+        if cases is None:
+            cases = list(self.cases.all())
+        if cases and self.instance.notification_template:
+            self.instance.notification_template.notify(dict(deployment_report=self))
+            from .tasks import update_case_to_fogbugz
+            for case in cases:
+                params = dict(report=self.id)
+                CaseEdit.objects.get_or_create(
+                    case=case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT, params=params)
+                update_case_to_fogbugz.apply_async(kwargs=dict(case_id=case.id))
+
 
 def deployment_report_changes(sender, instance, **kwargs):
     """Send case updates about the deployment status."""
-    if instance.cases.count() and instance.instance.notification_template:
-        instance.instance.notification_template.notify(dict(deployment_report=instance))
-        from .tasks import update_case_to_fogbugz
-        for case in instance.cases.all():
-            params = dict(report=instance.id)
-            CaseEdit.objects.get_or_create(
-                case=case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT, params=params)
-            update_case_to_fogbugz.apply_async(kwargs=dict(case_id=case.id))
+    instance.notify()
 
 
 post_save.connect(deployment_report_changes, sender=DeploymentReport)
+
+
+class CaseDeploymentManager(models.Manager):
+
+    """Case deployment manager."""
+
+    def update_deployments(self, case_ids, instance_ids=None):
+        """Update the last deployed reports of the cases from the deployment reports.
+
+        :param case_ids: ids of the cases to update
+        :param instance_ids: ids of the instances to update, all the instances if not given
+        """
+        case_ids = frozenset(case_ids)
+        if not case_ids:
+            return
+        reports = DeploymentReport.cases.through.objects.filter(
+            case__in=case_ids, deploymentreport__status=DeploymentReport.STATUS_DEPLOYED)
+        deployments = self.filter(case__in=case_ids)
+        if instance_ids is not None:
+            reports = reports.filter(deploymentreport__instance__in=instance_ids)
+            deployments = deployments.filter(instance__in=instance_ids)
+        last = {}
+        for case_id, instance_id, report_id, datetime in reports.order_by(
+                'deploymentreport__datetime', 'deploymentreport').values_list(
+                'case', 'deploymentreport__instance', 'deploymentreport', 'deploymentreport__datetime'):
+            last[case_id, instance_id] = report_id, datetime
+        with transaction.atomic():
+            deployments.delete()
+            self.bulk_create(
+                CaseDeployment(case_id=case_id, instance_id=instance_id, report_id=report_id, datetime=datetime)
+                for (case_id, instance_id), (report_id, datetime) in last.items())
+
+
+class CaseDeployment(models.Model):
+
+    """Last successful deployment of the case on the instance.
+
+    Denormalized from the deployment reports and maintained on their changes.
+    """
+
+    class Meta:
+        verbose_name = _("Case deployment")
+        verbose_name_plural = _("Case deployments")
+        unique_together = (("case", "instance"),)
+        index_together = (("instance", "case"),)
+
+    case = models.ForeignKey(Case, related_name='deployments')
+    instance = models.ForeignKey(Instance, related_name='case_deployments')
+    report = models.ForeignKey(
+        DeploymentReport, related_name='case_deployments', null=True, on_delete=models.SET_NULL)
+    datetime = models.DateTimeField()
+
+    objects = CaseDeploymentManager()
+
+    def __str__(self):
+        """String representation."""
+        return '{self.case_id}: {self.instance_id}: {self.report_id}'.format(self=self)
+
+
+def case_deployment_changes(sender, instance, **kwargs):
+    """Update the case deployments on the deployment report change."""
+    deployments = list(CaseDeployment.objects.filter(report=instance).values_list('case', 'instance'))
+    CaseDeployment.objects.update_deployments(
+        chain(instance.cases.values_list('id', flat=True), (deployment[0] for deployment in deployments)),
+        set(deployment[1] for deployment in deployments).union((instance.instance_id,)))
+
+
+def case_deployment_deletes(sender, instance, **kwargs):
+    """Update the case deployments which were referring to the deleted deployment report."""
+    deployments = list(CaseDeployment.objects.filter(report=None).values_list('case', 'instance'))
+    CaseDeployment.objects.update_deployments(
+        (deployment[0] for deployment in deployments), set(deployment[1] for deployment in deployments))
+
+
+def case_deployment_cases_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the case deployments on the deployment report cases change."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # the deployment reports of the case are changed
+        CaseDeployment.objects.update_deployments((instance.id,))
+    elif action == 'post_clear':
+        CaseDeployment.objects.update_deployments(
+            CaseDeployment.objects.filter(report=instance).values_list('case', flat=True), (instance.instance_id,))
+    else:
+        CaseDeployment.objects.update_deployments(pk_set, (instance.instance_id,))
+
+
+post_save.connect(case_deployment_changes, sender=DeploymentReport)
+post_delete.connect(case_deployment_deletes, sender=DeploymentReport)
+m2m_changed.connect(case_deployment_cases_changes, sender=DeploymentReport.cases.through)
+
+
+class DeploymentReportLogChunk(LogChunk):
+
+    """Deployment report log chunk."""
+
+    class Meta(LogChunk.Meta):
+        verbose_name = _("Deployment report log chunk")
+        verbose_name_plural = _("Deployment report log chunks")
+        unique_together = (("report", "offset"),)
+
+    report = models.ForeignKey(DeploymentReport, related_name='log_chunks')
+
+
+def get_model_version_cache_key(model):
+    """Get the cache key of the model data version."""
+    opts = model._meta.concrete_model._meta  # pylint: disable=W0212
+    return 'pdt:model-version:{0}.{1}'.format(opts.app_label, opts.model_name)
+
+
+def get_model_versions(*models_):
+    """Get the data versions of the models: datetimes of their latest changes.
+
+    Unknown versions are started from now, so the data is considered changed.
+
+    :return: list of the datetimes in the order of the models
+    :rtype: list
+    """
+    keys = [get_model_version_cache_key(model) for model in models_]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = timezone.now()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return [versions[key] for key in keys]
+
+
+pending_model_versions = threading.local()
+
+
+def touch_model_versions(*models_):
+    """Change the data versions of the models.
+
+    If the change is not committed yet, the versions are changed once more after the commit by
+    `touch_pending_model_versions`, as the data could have been read and cached under the new versions before.
+    """
+    now = timezone.now()
+    cache.set_many({get_model_version_cache_key(model): now for model in models_}, None)
+    if transaction.get_connection().in_atomic_block:
+        if not hasattr(pending_model_versions, 'models'):
+            pending_model_versions.models = set()
+        pending_model_versions.models.update(models_)
+
+
+def touch_pending_model_versions(**kwargs):  # pylint: disable=W0613
+    """Change the data versions of the models changed in the committed transactions."""
+    models_ = getattr(pending_model_versions, 'models', None)
+    if models_:
+        pending_model_versions.models = set()
+        touch_model_versions(*models_)
+
+
+request_finished.connect(touch_pending_model_versions)
+
+
+def model_version_changes(sender, **kwargs):
+    """Change the data version of the model on its change."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        touch_model_versions(sender)
+
+
+for versioned_model in (
+        Release, CIProject, Instance, Case, Migration, MigrationStep, PreDeployMigrationStep, PostDeployMigrationStep,
+        FinalMigrationStep, MigrationReport, MigrationStepReport, MigrationStepReportLogChunk, DeploymentReport,
+        DeploymentReportLogChunk):
+    post_save.connect(model_version_changes, sender=versioned_model)
+    post_delete.connect(model_version_changes, sender=versioned_model)
+m2m_changed.connect(model_version_changes, sender=Instance.ci_projects.through)
+m2m_changed.connect(model_version_changes, sender=DeploymentReport.cases.through)
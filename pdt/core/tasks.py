@@ -1,22 +1,34 @@
 """Celery tasks."""
+from datetime import timedelta
+import time
+
+from celery.signals import task_postrun
 from celery.utils.log import get_task_logger
 
 from celery_once import QueueOnce
 
 from django.conf import settings
 from django.db import IntegrityError
+from django.db.models import Min
+from django.utils import timezone
 from django.core.management import call_command
 
-import fogbugz
-
 from pdt.celery import app
+from pdt.core.fogbugz_client import fogbugz_pool
 from pdt.core.models import (
     Case,
+    CaseEdit,
+    CIProject,
+    DeploymentReport,
+    MigrationReport,
     Release,
+    touch_pending_model_versions,
 )
 
 logger = get_task_logger(__name__)
 
+task_postrun.connect(touch_pending_model_versions)
+
 
 @app.task(base=QueueOnce, once=dict(keys=('case_id',), graceful=True))
 def update_case_from_fogbugz(case_id):
@@ -38,23 +50,61 @@ def update_case_to_fogbugz(case_id):
     logger.info("Task finished")
 
 
+def sync_cases(cases):
+    """Create or update cases given the fetched Fogbugz case xml nodes, skipping the unchanged ones.
+
+    :param cases: list of beautifulsoup objects representing the case xml nodes
+    """
+    started = time.time()
+    count = Case.objects.update_from_fogbugz_cases(
+        cases, chunk_size=settings.FOGBUGZ_SYNC_CHUNK_SIZE, skip_unchanged=True)
+    duration = time.time() - started
+    logger.info(
+        'Synced %s cases in %.2f seconds (%.2f cases/s), %s cases were unchanged', count, duration,
+        len(cases) / duration if duration else len(cases), len(cases) - count)
+
+
+def search_cases(query):
+    """Fetch the cases matching the Fogbugz search query and sync them.
+
+    :param query: Fogbugz search query
+    :type query: str
+    """
+    with fogbugz_pool.client() as fb:
+        resp = fb.search(
+            q=query,
+            cols=Case.objects.case_info_columns,
+        )
+    cases = resp.findAll('case')
+    logger.info('Found %s cases to fetch from fogbugz', len(cases))
+    sync_cases(cases)
+
+
 @app.task(base=QueueOnce)
-def fetch_cases():
-    """Fetch missing and update existing cases from fogbugz for all known releases."""
+def fetch_cases(full=False):
+    """Fetch missing and update existing cases from fogbugz for all known releases.
+
+    Cases of the synced CI projects are fetched per project, only the ones edited since the last successful sync
+    of the project. Cases of the rest of the CI projects, including the ones which are not known yet, are fetched
+    all at once.
+
+    :param full: fetch all the cases instead of only the cases edited since the last successful sync
+    """
     logger.info("Start fetching cases")
-    fb = fogbugz.FogBugz(
-        settings.AUTH_FOGBUGZ_SERVER,
-        settings.FOGBUGZ_TOKEN)
     release_query = ' OR '.join('milestone:"{0}"'.format(release.number) for release in Release.objects.all())
-    resp = fb.search(
-        q='({0}) AND ({ciproject}:"*")'.format(release_query, ciproject=settings.FOGBUGZ_CI_PROJECT_FIELD_ID),
-        cols='sTitle,sOriginalTitle,sFixFor,dtFixFor,sProject,sArea,dtLastUpdated,tags,' +
-        settings.FOGBUGZ_CI_PROJECT_FIELD_ID
-    )
-    cases = resp.findAll('case')
-    logger.info('Found %s cases to fetch from fogbugz', len(cases))
-    for case_xml in cases:
-        update_case_from_fogbugz.apply_async(kwargs=dict(case_id=int(case_xml.attrs['ixbug'])))
+    field_id = settings.FOGBUGZ_CI_PROJECT_FIELD_ID
+    synced = [] if full else list(CIProject.objects.filter(synced_date__isnull=False))
+    for ci_project in synced:
+        started = timezone.now()
+        # fogbugz date search has a day granularity, overlapping cases are skipped as unchanged
+        search_cases('({0}) AND ({1}:"{2}") AND (edited:"{3:%m/%d/%Y}..")'.format(
+            release_query, field_id, ci_project.name, timezone.localtime(ci_project.synced_date) - timedelta(days=1)))
+        CIProject.objects.filter(id=ci_project.id).update(synced_date=started)
+    started = timezone.now()
+    search_cases('({0}) AND ({1}:"*"){2}'.format(release_query, field_id, ''.join(
+        ' AND -{0}:"{1}"'.format(field_id, ci_project.name) for ci_project in synced)))
+    CIProject.objects.exclude(id__in=[ci_project.id for ci_project in synced]).update(synced_date=started)
+    logger.info("Fogbugz client pool stats: %s", fogbugz_pool.stats())
     logger.info("Task finished")
 
 
@@ -62,21 +112,87 @@ def fetch_cases():
 def update_cases_from_fogbugz():
     """Update cases info from fogbugz."""
     logger.info("Start updating cases from fogbugz")
-    cases = Case.objects.filter(release__isnull=True)
-    logger.info("Found %s cases to update from fogbugz", len(cases))
-    for case in cases:
-        update_case_from_fogbugz.apply_async(kwargs=dict(case_id=case.id))
+    case_ids = list(Case.objects.filter(release__isnull=True).values_list('id', flat=True))
+    logger.info("Found %s cases to update from fogbugz", len(case_ids))
+    for start in range(0, len(case_ids), settings.FOGBUGZ_SYNC_CHUNK_SIZE):
+        with fogbugz_pool.client() as fb:
+            resp = fb.search(
+                q=','.join(str(case_id) for case_id in case_ids[start:start + settings.FOGBUGZ_SYNC_CHUNK_SIZE]),
+                cols=Case.objects.case_info_columns,
+            )
+        sync_cases(resp.findAll('case'))
+    logger.info("Fogbugz client pool stats: %s", fogbugz_pool.stats())
     logger.info("Task finished")
 
 
 @app.task(base=QueueOnce, once=dict(graceful=True))
 def update_cases_to_fogbugz():
-    """Update cases info to fogbugz."""
+    """Update cases info to fogbugz by draining the pending case edits, oldest first.
+
+    Failures of a case are logged and its edits are left pending, so they don't block the rest of the cases.
+    """
     logger.info("Start updating cases to fogbugz")
-    cases = Case.objects.all()
-    logger.info("Found %s cases to update to fogbugz", len(cases))
-    for case in cases:
-        update_case_to_fogbugz.apply_async(kwargs=dict(case_id=case.id))
+    case_ids = [case_id for case_id, _ in CaseEdit.objects.filter(datetime__lte=timezone.now()).values_list(
+        'case').annotate(first_datetime=Min('datetime')).order_by('first_datetime')]
+    logger.info("Found %s cases with pending edits to update to fogbugz", len(case_ids))
+    for start in range(0, len(case_ids), settings.FOGBUGZ_OUTBOX_BATCH_SIZE):
+        for case_id in case_ids[start:start + settings.FOGBUGZ_OUTBOX_BATCH_SIZE]:
+            try:
+                Case.objects.update_to_fogbugz(case_id)
+            except Exception:
+                logger.exception("Failed to update case %s to fogbugz", case_id)
+        logger.info("Updated %s of %s cases", min(start + settings.FOGBUGZ_OUTBOX_BATCH_SIZE, len(case_ids)),
+                    len(case_ids))
+    logger.info("Fogbugz client pool stats: %s", fogbugz_pool.stats())
+    logger.info("Task finished")
+
+
+@app.task(
+    bind=True, max_retries=settings.DEPLOYMENT_REPORT_CASES_RETRIES,
+    default_retry_delay=settings.DEPLOYMENT_REPORT_CASES_RETRY_DELAY)
+def attach_deployment_report_cases(self, report_id, case_ids):
+    """Fetch the deployment report cases which were not known during the report creation and attach them.
+
+    The deployment notifications are sent only for the attached cases, the rest of the report cases were notified
+    when the report was created.
+    """
+    logger.info("Start attaching %s cases to deployment report %s", len(case_ids), report_id)
+    try:
+        report = DeploymentReport.objects.get(id=report_id)
+    except DeploymentReport.DoesNotExist as e:
+        # the report creation is not committed yet
+        raise self.retry(exc=e)
+    cases, missing = Case.objects.get_or_create_many_from_fogbugz(case_ids)
+    if missing:
+        raise self.retry()
+    report.cases.add(*cases)
+    report.notify(cases)
+    logger.info("Task finished")
+
+
+@app.task(base=QueueOnce, once=dict(keys=('report_id',), graceful=True))
+def calculate_migration_report(report_id):
+    """Calculate migration report status and log if it's not calculated yet."""
+    logger.info("Start calculating migration report %s", report_id)
+    # the flag is set before the calculation, so the step report changes during it reset the flag again
+    if MigrationReport.objects.filter(id=report_id, is_calculated=False).update(is_calculated=True):
+        try:
+            MigrationReport.objects.get(id=report_id).calculate()
+        except Exception:
+            # the failed calculation is picked up by the next calculate_migration_reports run
+            MigrationReport.objects.filter(id=report_id).update(is_calculated=False)
+            raise
+    logger.info("Task finished")
+
+
+@app.task(base=QueueOnce, once=dict(graceful=True))
+def calculate_migration_reports():
+    """Calculate migration reports which step reports were changed during the previous calculation."""
+    logger.info("Start calculating migration reports")
+    report_ids = list(MigrationReport.objects.filter(is_calculated=False).values_list('id', flat=True))
+    logger.info("Found %s migration reports to calculate", len(report_ids))
+    for report_id in report_ids:
+        calculate_migration_report(report_id)
     logger.info("Task finished")
 
 
@@ -116,6 +116,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'pdt.api.pagination.KeysetPagination',
     'ORDERING_PARAM': 'order_by'
 }
 
@@ -236,6 +237,12 @@ CELERYBEAT_SCHEDULE = {
         'schedule': timedelta(hours=1),
         'args': ()
     },
+    'fetch_cases_full': {
+        'task': 'pdt.core.tasks.fetch_cases',
+        'schedule': timedelta(days=1),
+        'args': (),
+        'kwargs': {'full': True},
+    },
     'update_cases_from_fogbugz': {
         'task': 'pdt.core.tasks.update_cases_from_fogbugz',
         'schedule': timedelta(hours=1),
@@ -246,6 +253,11 @@ CELERYBEAT_SCHEDULE = {
         'schedule': timedelta(hours=1),
         'args': ()
     },
+    'calculate_migration_reports': {
+        'task': 'pdt.core.tasks.calculate_migration_reports',
+        'schedule': timedelta(minutes=1),
+        'args': (),
+    },
     'send_emails': {
         'task': 'pdt.core.tasks.send_emails',
         'schedule': timedelta(minutes=1),
@@ -258,6 +270,39 @@ FOGBUGZ_TOKEN = yam_config['fogbugz']['token']
 FOGBUGZ_CI_PROJECT_FIELD_ID = yam_config['fogbugz']['ci_project_field_id']
 FOGBUGZ_MIGRATION_URL_FIELD_ID = yam_config['fogbugz']['migration_url_field_id']
 FOGBUGZ_REVISION_FIELD_ID = yam_config['fogbugz']['revision_field_id']
+# Number of cases to upsert in a single transaction during the bulk sync
+FOGBUGZ_SYNC_CHUNK_SIZE = 500
+# Number of cases with pending edits to push in a single batch
+FOGBUGZ_OUTBOX_BATCH_SIZE = 100
+# Maximum number of the unknown deployment report cases fetched from Fogbugz during the request, the rest are
+# fetched and attached to the report asynchronously
+DEPLOYMENT_REPORT_CASES_FETCH_LIMIT = 100
+# Delay (seconds) before retrying to fetch the deployment report cases asynchronously, and the number of retries
+DEPLOYMENT_REPORT_CASES_RETRY_DELAY = 60
+DEPLOYMENT_REPORT_CASES_RETRIES = 10
+# Fogbugz client pool: max concurrent clients per process and the wait timeout (seconds) for a free client
+FOGBUGZ_POOL_SIZE = 4
+FOGBUGZ_POOL_TIMEOUT = 60
+# Fogbugz API call retries on connection failures and throttling, with exponential backoff (seconds)
+FOGBUGZ_RETRIES = 3
+FOGBUGZ_RETRY_BACKOFF = 0.5
+# Suspend Fogbugz API calls for the timeout (seconds) after the number of consecutive failures
+FOGBUGZ_CIRCUIT_BREAKER_THRESHOLD = 5
+FOGBUGZ_CIRCUIT_BREAKER_TIMEOUT = 60
+# Trust the local case tags when pushing the case edits, only re-reading the case if it was changed in Fogbugz
+FOGBUGZ_TRUST_LOCAL_CASE_INFO = True
+# Delay (seconds) of the migration report calculation to coalesce the step reports of the same migration application
+MIGRATION_REPORT_CALCULATION_DELAY = 10
+# Store the migration report log assembled from the step reports, otherwise it's assembled on read
+MIGRATION_REPORT_STORE_LOG = True
+# Minimum length of the report log to store it compressed
+LOG_COMPRESSION_MIN_LENGTH = 1024
+# Zlib compression level of the report logs
+LOG_COMPRESSION_LEVEL = 6
+# Timeout (seconds) of the cached topological ordering of the CI project migrations
+MIGRATION_ORDERING_CACHE_TIMEOUT = 24 * 60 * 60
+# Timeout (seconds) of the cached API list responses, they are not read anymore once the models change
+API_RESPONSE_CACHE_TIMEOUT = 60 * 60
 AUTH_FOGBUGZ_SERVER = FOGBUGZ_URL = yam_config['fogbugz']['url']
 
 ALLOWED_HOSTS = ['.{0}'.format(yam_config['hostname'])] if yam_config['hostname'] else []
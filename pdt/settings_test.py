@@ -8,6 +8,12 @@ DATABASES.update({
     }
 })
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 RAVEN_CONFIG = {
     'dsn': None
 }
@@ -0,0 +1,99 @@
+"""Benchmark of the API filters.
+
+Benchmarks populate a lot of data, so they only run if the ``PDT_BENCHMARK`` environment variable is set, e.g.
+``PDT_BENCHMARK=1 py.test tests/benchmark``. The data size is set via ``PDT_BENCHMARK_MIGRATIONS``,
+``PDT_BENCHMARK_INSTANCES`` and ``PDT_BENCHMARK_REPORTS`` (reports per migration) environment variables. The timings
+are written to the terminal report.
+"""
+import os
+import time
+
+from django.db.models import Q
+from django.utils import timezone
+import pytest
+
+from pdt.api.views import (
+    CaseFilter,
+    MigrationFilter,
+)
+from pdt.core.models import (
+    Case,
+    CIProject,
+    DeploymentReport,
+    Instance,
+    Migration,
+    MigrationReport,
+    Release,
+)
+
+MIGRATIONS = int(os.environ.get('PDT_BENCHMARK_MIGRATIONS', 100000))
+INSTANCES = int(os.environ.get('PDT_BENCHMARK_INSTANCES', 50))
+REPORTS = int(os.environ.get('PDT_BENCHMARK_REPORTS', 5))
+
+pytestmark = pytest.mark.skipif(not os.environ.get('PDT_BENCHMARK'), reason='PDT_BENCHMARK is not set')
+
+
+@pytest.fixture
+def benchmark_data(transactional_db):
+    """Populate the migrations, the instances and the reports bypassing the model signals."""
+    ci_project = CIProject.objects.create(name='benchmark')
+    release = Release.objects.create(number=1, datetime=timezone.now())
+    instances = Instance.objects.bulk_create(
+        Instance(name='benchmark-{0}'.format(index)) for index in range(INSTANCES))
+    instances = list(Instance.objects.filter(name__startswith='benchmark-'))
+    for instance in instances:
+        instance.ci_projects.add(ci_project)
+    Case.objects.bulk_create(
+        (Case(id=index + 1, title='Case {0}'.format(index), ci_project=ci_project, release=release)
+         for index in range(MIGRATIONS)), batch_size=1000)
+    Migration.objects.bulk_create(
+        (Migration(uid='migration-{0}'.format(index), case_id=index + 1) for index in range(MIGRATIONS)),
+        batch_size=1000)
+    migration_ids = list(Migration.objects.values_list('id', flat=True))
+    MigrationReport.objects.bulk_create(
+        (MigrationReport(
+            migration_id=migration_id, instance=instances[(index + offset) % len(instances)],
+            status=MigrationReport.STATUS_APPLIED if offset else MigrationReport.STATUS_ERROR)
+         for index, migration_id in enumerate(migration_ids) for offset in range(REPORTS)), batch_size=1000)
+    report = DeploymentReport.objects.create(instance=instances[0], status=DeploymentReport.STATUS_DEPLOYED)
+    report.cases = Case.objects.filter(id__lte=MIGRATIONS // 2)
+    return dict(instance=instances[-1], ci_project=ci_project, release=release)
+
+
+@pytest.fixture
+def measure(request):
+    """Measure the time to fetch the ids of the queryset, writing it to the terminal report."""
+    reporter = request.config.pluginmanager.getplugin('terminalreporter')
+
+    def measure(name, queryset):
+        """Fetch the ids of the queryset."""
+        started = time.time()
+        ids = set(queryset.values_list('id', flat=True))
+        reporter.write_line('{0}: {1} rows in {2:.3f} seconds'.format(name, len(ids), time.time() - started))
+        return ids
+    return measure
+
+
+def test_migration_filter(benchmark_data, measure):
+    """Compare the migration filter with the joins and distinct."""
+    instance = benchmark_data['instance']
+    joined = measure('Migrations, joins', Migration.objects.filter(
+        Q(reports__instance__name=instance.name) | Q(reports__isnull=True) |
+        Q(case__ci_project__instances__name=instance.name)).filter(
+        Q(reports__status__gt=MigrationReport.STATUS_APPLIED) | Q(reports__status__lt=MigrationReport.STATUS_APPLIED) |
+        Q(reports__isnull=True)).distinct())
+    filtered = measure('Migrations, exists', MigrationFilter(dict(
+        instance=instance.name, exclude_status=MigrationReport.STATUS_APPLIED), queryset=Migration.objects.all()).qs)
+    assert joined == filtered
+
+
+def test_case_filter(benchmark_data, measure):
+    """Compare the case filter with the joins and distinct."""
+    instance = Instance.objects.get(name='benchmark-0')
+    joined = measure('Cases, joins', Case.objects.filter(
+        deployment_reports__instance__name=instance.name,
+        deployment_reports__status=DeploymentReport.STATUS_DEPLOYED).distinct())
+    filtered = measure('Cases, exists', CaseFilter(dict(
+        deployed_on=instance.name, ci_project=benchmark_data['ci_project'].name,
+        release=benchmark_data['release'].number), queryset=Case.objects.all()).qs)
+    assert joined == filtered
@@ -1,4 +1,6 @@
 """PDT tests configuration."""
+import collections
+
 import mock
 
 import factory.fuzzy
@@ -8,6 +10,11 @@ import pytest
 import py
 from pytest_factoryboy import register
 
+from django.core.cache import cache
+from django.db.models.sql.compiler import SQLCompiler
+from django.db.models.sql.constants import MULTI
+
+from pdt.core.fogbugz_client import fogbugz_pool
 from pdt.core.models import (
     DeploymentReport,
     MigrationReport,
@@ -47,14 +54,44 @@ def equals_any():
     return EqualsAny()
 
 
+@pytest.fixture
+def db_bytes(monkeypatch):
+    """Count the rows and the bytes of the values fetched from the database."""
+    counter = collections.Counter()
+    execute_sql = SQLCompiler.execute_sql
+
+    def count(chunks):
+        for rows in chunks:
+            for row in rows:
+                counter['rows'] += 1
+                counter['bytes'] += sum(len(str(value).encode('utf-8')) for value in row if value is not None)
+            yield rows
+
+    def counting_execute_sql(self, result_type=MULTI):
+        result = execute_sql(self, result_type)
+        if result_type != MULTI:
+            return result
+        return list(count(result)) if isinstance(result, list) else count(result)
+
+    monkeypatch.setattr(SQLCompiler, 'execute_sql', counting_execute_sql)
+    return counter
+
+
 @pytest.yield_fixture(autouse=True)
 def mocked_fogbugz(monkeypatch):
     """Mock Fogbugz class to avoid external connections."""
     mocked_fogbugz = mock.patch('fogbugz.FogBugz')
+    fogbugz_pool.clear()
     yield mocked_fogbugz.start()
     mocked_fogbugz.stop()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Clear the cache, the cached model versions and responses do not survive the test database rollback."""
+    cache.clear()
+
+
 @register
 class ReleaseFactory(factory.django.DjangoModelFactory):
 
@@ -1,15 +1,23 @@
 """Test public API."""
+import binascii
 import json
+import os
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.dateparse import parse_datetime
+import mock
 import pytest
 
+from pdt.api.caching import response_cache
 from pdt.core.models import (
     Case,
     CaseEdit,
     DeploymentReport,
     MigrationReport,
     MigrationStepReport,
+    PreDeployMigrationStep,
+    touch_pending_model_versions,
 )
 
 
@@ -63,7 +71,7 @@ def test_migration_filter_exclude_status(admin_client, migration_report_factory,
             },
             'status': mr1.status,
             'datetime': equals_any,
-            'log': mr1.log
+            'log': mr1.get_log()
         }, {
             'id': mr2.id,
             'instance': {
@@ -78,7 +86,7 @@ def test_migration_filter_exclude_status(admin_client, migration_report_factory,
             },
             'status': mr2.status,
             'datetime': equals_any,
-            'log': mr2.log
+            'log': mr2.get_log()
         }],
         'release': {
             'id': migration.case.release.id,
@@ -150,6 +158,96 @@ def test_migration_filter_release(admin_client, migration_report_factory, instan
     assert {data[0]['uid'], data[1]['uid']} == {mr1.migration.uid, mr2.migration.uid}
 
 
+def test_migration_list_queries(admin_client, migration_report_factory, instance):
+    """Test the number of queries to list the migrations does not depend on the number of migrations."""
+    ci_project = instance.ci_projects.first()
+
+    def get_migrations():
+        with CaptureQueriesContext(connection) as context:
+            data = admin_client.get('/api/migrations/', dict(
+                ci_project=ci_project.name, instance=instance.name, exclude_status='err')).data
+        return len(data), len(context)
+
+    migration_report_factory(instance=instance, migration__case__ci_project=ci_project)
+    count, queries = get_migrations()
+    for _ in range(3):
+        migration_report_factory(instance=instance, migration__case__ci_project=ci_project)
+    assert get_migrations() == (count + 3, queries)
+
+
+def test_migration_ancestors(admin_client, migration_factory, ci_project):
+    """Test migration ancestors are listed from the root and filtered."""
+    root = migration_factory(case__ci_project=ci_project)
+    parent = migration_factory(case__ci_project=ci_project, parent=root)
+    child = migration_factory(case__ci_project=ci_project, parent=parent)
+    other = migration_factory(case__ci_project=ci_project)
+    data = admin_client.get('/api/migrations/{0}/ancestors/'.format(child.uid)).data
+    assert [migration['uid'] for migration in data] == [root.uid, parent.uid]
+    # reparenting updates the ancestors of the whole subtree
+    parent.parent = other
+    parent.save()
+    data = admin_client.get('/api/migrations/{0}/ancestors/'.format(child.uid)).data
+    assert [migration['uid'] for migration in data] == [other.uid, parent.uid]
+    data = admin_client.get('/api/migrations/', dict(ancestor_of=child.uid)).data
+    assert [migration['uid'] for migration in data] == [other.uid, parent.uid]
+
+
+def test_migration_list_sort_error(admin_client, migration_factory, ci_project):
+    """Test migrations which can not be sorted are answered with the conflict listing their uids."""
+    parent = migration_factory(case__ci_project=ci_project)
+    child = migration_factory(case__ci_project=ci_project, parent=parent)
+    parent.parent = child
+    parent.save()
+    other_ci_project_migration = migration_factory()
+    response = admin_client.get('/api/migrations/', dict(ci_project=ci_project.name))
+    assert response.status_code == 409
+    assert response.data['uids'] == sorted([parent.uid, child.uid])
+    data = admin_client.get(
+        '/api/migrations/', dict(ci_project=other_ci_project_migration.case.ci_project.name)).data
+    assert [migration['uid'] for migration in data] == [other_ci_project_migration.uid]
+
+
+def test_migration_status_matrix(admin_client, migration_report_factory, migration_factory, instance_factory):
+    """Test migration status matrix is maintained on the report changes."""
+    mr1 = migration_report_factory()
+    mr2 = migration_report_factory(migration=mr1.migration, status=MigrationReport.STATUS_ERROR)
+    ci_project = mr1.migration.case.ci_project
+    mr3 = migration_report_factory(instance=mr1.instance, migration__case__ci_project=ci_project)
+    migration_report_factory()
+    # the migration and the instance without reports are listed as well
+    migration = migration_factory(case__ci_project=ci_project)
+    instance = instance_factory(ci_projects=[ci_project])
+
+    def get_matrix():
+        with CaptureQueriesContext(connection) as context:
+            data = admin_client.get('/api/migrations/matrix/', dict(ci_project=ci_project.name)).data
+        # one query for the migrations joined with their statuses and one for the instances of the CI project
+        assert len([
+            query for query in context.captured_queries
+            if 'core_migration' in query['sql'] or 'core_instance' in query['sql']]) == 2
+        return data['instances'], dict(zip(data['migrations'], data['statuses']))
+
+    instances = sorted([mr1.instance.name, mr2.instance.name, instance.name])
+    column = instances.index(mr1.instance.name)
+    other_column = instances.index(mr2.instance.name)
+    assert get_matrix() == (instances, {
+        mr1.migration.uid: [
+            MigrationReport.STATUS_APPLIED if index == column else
+            MigrationReport.STATUS_ERROR if index == other_column else None for index in range(3)],
+        mr3.migration.uid: [MigrationReport.STATUS_APPLIED if index == column else None for index in range(3)],
+        migration.uid: [None] * 3,
+    })
+    mr2.status = MigrationReport.STATUS_APPLIED
+    mr2.save()
+    mr3.delete()
+    assert get_matrix() == (instances, {
+        mr1.migration.uid: [None if index == instances.index(instance.name) else MigrationReport.STATUS_APPLIED
+                            for index in range(3)],
+        mr3.migration.uid: [None] * 3,
+        migration.uid: [None] * 3,
+    })
+
+
 def test_create_migration_no_case(mocked_fogbugz, admin_client):
     """Test create migration when fb case is not found."""
     mocked_fogbugz.return_value.search.return_value.cases.find.return_value = None
@@ -221,6 +319,74 @@ def test_create_migration(mocked_fogbugz, admin_client):
     assert Case.objects.get(id=33322)
 
 
+@pytest.mark.parametrize('case__id', [33322])
+def test_update_migration_steps_diff(migration_factory, mocked_fogbugz, admin_client, case, case__id):
+    """Test update migration only writes the changed steps and skips the unchanged migration."""
+    migration = migration_factory(case=case)
+    steps = {
+        "pre_deploy_steps": [
+            {"type": "mysql", "code": "SELECT * from some"},
+            {"type": "mysql", "code": "SELECT * from other"},
+        ],
+        "post_deploy_steps": [{"type": "python", "code": "import some", "path": "some.py"}],
+        "final_steps": [],
+    }
+
+    def post():
+        return admin_client.post('/api/migrations/', data=json.dumps(dict(
+            steps, uid=migration.uid, parent=None, case={"id": case__id}, category="onl")),
+            content_type='application/json')
+
+    response = post()
+    assert response.status_code == 201
+    step_ids = [step['id'] for step in response.data['pre_deploy_steps'] + response.data['post_deploy_steps']]
+    etag = response['ETag']
+    with mock.patch('pdt.core.tasks.update_case_to_fogbugz.apply_async') as mocked_apply_async:
+        with CaptureQueriesContext(connection) as context:
+            response = post()
+        statements = set(query['sql'].split(' ', 1)[0] for query in context.captured_queries)
+        assert not statements.intersection(('INSERT', 'UPDATE', 'DELETE'))
+        assert not mocked_apply_async.called
+    assert response.status_code == 200
+    assert response['ETag'] == etag
+    assert [step['id'] for step in response.data['pre_deploy_steps'] + response.data['post_deploy_steps']] == step_ids
+    steps['pre_deploy_steps'][1]['code'] = "SELECT * from another"
+    response = post()
+    assert response.status_code == 201
+    assert response['ETag'] != etag
+    assert response.data['pre_deploy_steps'][0]['id'] == step_ids[0]
+    assert response.data['pre_deploy_steps'][1]['id'] not in step_ids
+    assert response.data['pre_deploy_steps'][1]['code'] == "SELECT * from another"
+    # the step changed outside of the upload resets the digest
+    PreDeployMigrationStep.objects.filter(id=step_ids[0]).first().save()
+    assert post().status_code == 201
+
+
+@pytest.mark.parametrize('case__id', [33322])
+def test_migration_conditional_get_steps_added(migration_factory, admin_client, case, case__id):
+    """Test the migration entity tag changes when the update only adds the steps."""
+    migration = migration_factory(case=case)
+    # the test transaction is not committed, so the pending versions are changed as if it was
+    touch_pending_model_versions()
+    params = dict(case=case__id)
+    response = admin_client.get('/api/migrations/', params)
+    etag = response['ETag']
+    steps = response.data[0]['pre_deploy_steps']
+    assert admin_client.get('/api/migrations/', params, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    response = admin_client.post('/api/migrations/', data=json.dumps(dict(
+        uid=migration.uid, parent=None, case={"id": case__id}, category="onl",
+        pre_deploy_steps=[dict(type=step['type'], code=step['code'], path=step['path']) for step in steps] + [
+            {"type": "mysql", "code": "SELECT * from added"}],
+        post_deploy_steps=[
+            dict(type=step.type, code=step.code, path=step.path) for step in migration.post_deploy_steps.all()],
+        final_steps=[])), content_type='application/json')
+    assert response.status_code == 201
+    response = admin_client.get('/api/migrations/', params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert response.data[0]['pre_deploy_steps'][-1]['code'] == "SELECT * from added"
+
+
 @pytest.mark.parametrize('case__id', [33322])
 def test_update_migration(migration_factory, mocked_fogbugz, admin_client, case, case__id):
     """Test update migration."""
@@ -407,6 +573,48 @@ def test_create_deployment_report(mocked_fogbugz, admin_client, instance, releas
     assert CaseEdit.objects.filter(case=case).first().type == CaseEdit.TYPE_DEPLOYMENT_REPORT
 
 
+@pytest.mark.parametrize('fetch_limit', [10, 0])
+def test_create_deployment_report_unknown_cases(mocked_fogbugz, admin_client, settings, instance, case, fetch_limit):
+    """Test create deployment report fetches the unknown cases at once or attaches them asynchronously."""
+    settings.DEPLOYMENT_REPORT_CASES_FETCH_LIMIT = fetch_limit
+    unknown_case_id = case.id + 1
+    not_found_case_id = case.id + 2
+    mocked_case = mock.MagicMock()
+    mocked_fogbugz.return_value.search.return_value.findAll.return_value = [mocked_case]
+    mocked_case.attrs = dict(ixbug=unknown_case_id)
+    mocked_case.sfixfor.string = str(case.release.number)
+    mocked_case.dtfixfor.string = '2015-01-18T23:00:00Z'
+    mocked_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_case.stitle.string = 'Some title'
+    mocked_case.soriginaltitle.string = 'Some original title'
+    mocked_case.cixproject.string = case.ci_project.name
+    mocked_case.sproject.string = 'Some project'
+    mocked_case.sarea.string = 'Some area'
+    mocked_case.revision.string = '123123'
+    with mock.patch('pdt.api.serializers.attach_deployment_report_cases.apply_async') as mocked_apply_async:
+        data = admin_client.post(
+            '/api/deployment-reports/', data=json.dumps({
+                "instance": {"name": instance.name, "ci_projects": [{"name": instance.ci_projects.first().name}]},
+                "status": DeploymentReport.STATUS_DEPLOYED,
+                "cases": [{"id": case.id}, {"id": unknown_case_id}, {"id": not_found_case_id}]
+            }), content_type='application/json').data
+    report = DeploymentReport.objects.get(id=data['id'])
+    # the known cases are notified at once
+    assert CaseEdit.objects.filter(case=case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT).exists()
+    if fetch_limit:
+        mocked_fogbugz.return_value.search.assert_called_once_with(
+            q='{0},{1}'.format(unknown_case_id, not_found_case_id), cols=mock.ANY, max=2)
+        assert set(report.cases.values_list('id', flat=True)) == {case.id, unknown_case_id}
+        assert data['not_found_cases'] == [not_found_case_id]
+        assert not mocked_apply_async.called
+    else:
+        assert not mocked_fogbugz.return_value.search.called
+        assert list(report.cases.values_list('id', flat=True)) == [case.id]
+        assert data['not_found_cases'] == []
+        mocked_apply_async.assert_called_once_with(
+            kwargs=dict(report_id=report.id, case_ids=[unknown_case_id, not_found_case_id]))
+
+
 def test_case_filter_ci_project(admin_client, case_factory):
     """Test case filter when CI project parameter is used."""
     case_factory(ci_project__name='some-other-project')
@@ -497,3 +705,211 @@ def test_case_filter_exclude_deployed_on(
             exclude_deployed_on=instance.name, ci_project=instance.ci_projects.first().name,
             release=release.number)).data
     assert len(data) == 0
+
+
+def test_case_conditional_get(admin_client, case_factory, ci_project):
+    """Test unchanged cases are answered with 304 without querying them."""
+    case = case_factory(ci_project=ci_project)
+    # the test transaction is not committed, so the pending versions are changed as if it was
+    touch_pending_model_versions()
+    params = dict(ci_project=ci_project.name)
+    response = admin_client.get('/api/cases/', params)
+    assert response.status_code == 200
+    etag, last_modified = response['ETag'], response['Last-Modified']
+    with CaptureQueriesContext(connection) as context:
+        response = admin_client.get('/api/cases/', params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert not response.content
+    assert response['ETag'] == etag
+    assert not any('core_case' in query['sql'] for query in context.captured_queries)
+    assert admin_client.get('/api/cases/', params, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+    # the entity tag takes precedence over the modification date
+    assert admin_client.get(
+        '/api/cases/', params, HTTP_IF_NONE_MATCH='"other"', HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 200
+    # the filtered set has its own entity tag
+    assert admin_client.get('/api/cases/', dict(id=case.id), HTTP_IF_NONE_MATCH=etag).status_code == 200
+    case.title = 'changed'
+    case.save()
+    response = admin_client.get('/api/cases/', params, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data[0]['title'] == 'changed'
+    assert response['ETag'] != etag
+
+
+def test_case_list_cache(admin_client, case_factory, ci_project):
+    """Test the case list is served from the cache until the cases are changed."""
+    case = case_factory(ci_project=ci_project)
+    # the test transaction is not committed, so the pending versions are changed as if it was
+    touch_pending_model_versions()
+    query = 'ci_project={0}&release={1}'.format(ci_project.name, case.release.number)
+    data = admin_client.get('/api/cases/?' + query).data
+    # the query string is normalized
+    with CaptureQueriesContext(connection) as context:
+        assert admin_client.get('/api/cases/?' + '&'.join(reversed(query.split('&')))).data == data
+    assert not any('core_case' in statement['sql'] for statement in context.captured_queries)
+    case.title = 'changed'
+    case.save()
+    assert admin_client.get('/api/cases/?' + query).data[0]['title'] == 'changed'
+    assert response_cache.stats(['cases']) == {'cases': dict(hits=1, misses=2, ratio=0.333)}
+
+
+def test_create_migration_step_reports_bulk(admin_client, migration_report_factory):
+    """Test create migration step reports in bulk."""
+    migration_report = migration_report_factory()
+    migration = migration_report.migration
+    steps = list(migration.get_steps())
+    data = admin_client.post(
+        '/api/migration-step-reports/bulk/', data=json.dumps({
+            "report": {
+                "instance": {
+                    "name": migration_report.instance.name,
+                },
+                "migration": {
+                    "uid": migration.uid
+                },
+            },
+            "step_reports": [{
+                "step": {"id": step.id},
+                "status": MigrationStepReport.STATUS_APPLIED,
+                "log": "log of step {0}".format(step.id),
+            } for step in steps],
+        }), content_type='application/json').data
+    assert [step_report['step']['id'] for step_report in data] == [step.id for step in steps]
+    migration_report.refresh_from_db()
+    assert migration_report.step_reports.count() == len(steps)
+    assert migration_report.status == MigrationReport.STATUS_APPLIED
+    assert all('log of step {0}'.format(step.id) in migration_report.log for step in steps)
+
+
+def test_create_migration_step_reports_bulk_wrong_step(admin_client, migration_report_factory, migration_factory):
+    """Test create migration step reports in bulk with the step of another migration."""
+    migration_report = migration_report_factory()
+    other_step = migration_factory().pre_deploy_steps.first()
+    response = admin_client.post(
+        '/api/migration-step-reports/bulk/', data=json.dumps({
+            "report": {
+                "instance": {
+                    "name": migration_report.instance.name,
+                },
+                "migration": {
+                    "uid": migration_report.migration.uid
+                },
+            },
+            "step_reports": [{"step": {"id": other_step.id}, "status": MigrationStepReport.STATUS_APPLIED}],
+        }), content_type='application/json')
+    assert response.status_code == 400
+    assert not migration_report.step_reports.filter(step=other_step).exists()
+
+
+def test_deployment_report_log_chunks(admin_client, deployment_report):
+    """Test append the deployment report log in chunks and get the log range."""
+    url = '/api/deployment-reports/{0}/log/'.format(deployment_report.id)
+    length = len(deployment_report.log)
+    data = admin_client.post(
+        url, data=json.dumps({"offset": length, "log": "first chunk\n"}), content_type='application/json').data
+    assert data == {'offset': length, 'length': length + 12}
+    # retried chunk is ignored
+    data = admin_client.post(
+        url, data=json.dumps({"offset": length, "log": "first chunk\n"}), content_type='application/json').data
+    assert data['length'] == length + 12
+    response = admin_client.post(
+        url, data=json.dumps({"offset": length, "log": "other chunk\n"}), content_type='application/json')
+    assert response.status_code == 409
+    assert response.data['length'] == length + 12
+    admin_client.post(
+        url, data=json.dumps({"offset": length + 12, "log": "second chunk\n"}), content_type='application/json')
+    data = admin_client.get(url, dict(offset=length + 6, limit=12)).data
+    assert data == {'offset': length + 6, 'length': length + 25, 'log': 'chunk\nsecond'}
+    assert DeploymentReport.objects.get(id=deployment_report.id).get_log() == (
+        deployment_report.log + 'first chunk\nsecond chunk\n')
+
+
+def test_replace_log_drops_chunks(admin_client, deployment_report, migration_report_factory):
+    """Test the appended log chunks are dropped when the whole log is replaced."""
+    deployment_report.append_log(len(deployment_report.log), 'appended chunk\n')
+    response = admin_client.patch(
+        '/api/deployment-reports/{0}/'.format(deployment_report.id), data=json.dumps({"log": "replaced\n"}),
+        content_type='application/json')
+    assert response.status_code == 200
+    deployment_report.refresh_from_db()
+    assert deployment_report.get_log() == 'replaced\n'
+    assert deployment_report.get_log_length() == len('replaced\n')
+    migration_report = migration_report_factory()
+    step_report = migration_report.step_reports.first()
+    step_report.append_log(len(step_report.log), 'appended chunk\n')
+    admin_client.post(
+        '/api/migration-step-reports/bulk/', data=json.dumps({
+            "report": {
+                "instance": {"name": migration_report.instance.name},
+                "migration": {"uid": migration_report.migration.uid},
+            },
+            "step_reports": [{"step": {"id": step_report.step.id}, "status": step_report.status, "log": "replaced\n"}],
+        }), content_type='application/json')
+    assert MigrationStepReport.objects.get(id=step_report.id).get_log() == 'replaced\n'
+
+
+@pytest.mark.parametrize('params', [{}, {'fields': 'id,status'}])
+def test_deployment_report_list_log_deferred(admin_client, deployment_report_factory, db_bytes, params):
+    """Test the deployment report logs are not fetched from the database for the list unless requested."""
+    log = binascii.hexlify(os.urandom(10000)).decode('ascii')
+    for _ in range(5):
+        deployment_report_factory(log=log)
+    db_bytes.clear()
+    data = admin_client.get('/api/deployment-reports/', params).data
+    assert len(data) == 5
+    assert 'log' not in data[0]
+    assert db_bytes['bytes'] < len(log)
+    db_bytes.clear()
+    data = admin_client.get('/api/deployment-reports/', dict(params, include='log')).data
+    assert data[0]['log'] == log
+    assert db_bytes['bytes'] > 5 * len(log) // 2
+
+
+def test_deployment_report_cursor_pagination(admin_client, deployment_report_factory, instance):
+    """Test deployment reports are paginated by the cursor."""
+    reports = [deployment_report_factory(instance=instance) for _ in range(5)]
+    data = admin_client.get('/api/deployment-reports/', dict(page_size=2)).data
+    ids = [report['id'] for report in data['results']]
+    while data['next']:
+        data = admin_client.get(data['next']).data
+        ids.extend(report['id'] for report in data['results'])
+    assert ids == [report.id for report in reports]
+
+
+def test_deployment_report_cursor_pagination_instances(admin_client, deployment_report_factory, instance_factory):
+    """Test deployment reports of the instances which names sort differently from the ids are paginated."""
+    instances = [instance_factory(name=name) for name in ('instance-c', 'instance-b', 'instance-a')]
+    reports = [deployment_report_factory(instance=instance) for _ in range(2) for instance in instances]
+    data = admin_client.get('/api/deployment-reports/', dict(page_size=2)).data
+    ids = [report['id'] for report in data['results']]
+    while data['next']:
+        data = admin_client.get(data['next']).data
+        ids.extend(report['id'] for report in data['results'])
+    assert ids == [
+        report.id for report in sorted(reports, key=lambda report: (report.instance_id, report.datetime, report.id))]
+
+
+@pytest.mark.parametrize('order_by', ['release', '-release'])
+def test_case_cursor_pagination_null_release(admin_client, case_factory, order_by):
+    """Test cases are paginated by the cursor across the null and non-null releases."""
+    cases = [case_factory(release=None) for _ in range(3)] + [case_factory() for _ in range(3)]
+    touch_pending_model_versions()
+    data = admin_client.get('/api/cases/', dict(order_by=order_by, page_size=2)).data
+    ids = [case['id'] for case in data['results']]
+    while data['next']:
+        data = admin_client.get(data['next']).data
+        ids.extend(case['id'] for case in data['results'])
+    assert ids == list(Case.objects.filter(id__in=[case.id for case in cases]).order_by(
+        order_by + '_id', 'id').values_list('id', flat=True))
+
+
+def test_migration_cursor_pagination(admin_client, migration_factory, ci_project):
+    """Test topologically sorted migrations are paginated by the cursor."""
+    root = migration_factory(case__ci_project=ci_project)
+    parent = migration_factory(case__ci_project=ci_project, parent=root)
+    child = migration_factory(case__ci_project=ci_project, parent=parent)
+    data = admin_client.get('/api/migrations/', dict(page_size=2)).data
+    assert [migration['uid'] for migration in data['results']] == [root.uid, parent.uid]
+    data = admin_client.get(data['next']).data
+    assert [migration['uid'] for migration in data['results']] == [child.uid]
+    assert data['next'] is None
@@ -1,8 +1,25 @@
 """Test core models."""
+import fogbugz
 import mock
 import pytest
 
-from pdt.core.models import Case
+from django.core.signals import request_finished
+from django.db import connection, DatabaseError
+from django.test.utils import CaptureQueriesContext
+
+from pdt.core.fields import COMPRESSED_PREFIX
+from pdt.core.models import (
+    Case,
+    CaseDeployment,
+    CaseEdit,
+    DeploymentReport,
+    FinalMigrationStep,
+    Migration,
+    MigrationClosure,
+    MigrationSortError,
+    MigrationStep,
+    get_model_versions,
+)
 
 
 @pytest.mark.django_db
@@ -25,6 +42,99 @@ def test_get_or_create_case(mocked_fogbugz, release):
     assert case.revision == '123123'
 
 
+@pytest.mark.django_db
+def test_update_from_fogbugz_cases_skips_failed(release):
+    """Test the case which fails to be upserted is skipped without rolling back the rest of the chunk."""
+    cases = []
+    for case_id in (1234, 1235):
+        mocked_case = mock.MagicMock()
+        mocked_case.attrs = dict(ixbug=case_id)
+        mocked_case.sfixfor.string = str(release.number)
+        mocked_case.dtfixfor.string = str(release.datetime)
+        mocked_case.dtlastupdated.string = str(release.datetime)
+        mocked_case.stitle.string = 'Some title'
+        mocked_case.soriginaltitle.string = 'Some original title'
+        mocked_case.cixproject.string = 'ci-project'
+        mocked_case.sproject.string = 'Some project'
+        mocked_case.sarea.string = 'Some area'
+        mocked_case.revision.string = '123123'
+        cases.append(mocked_case)
+    update_from_case_info = Case.objects.update_from_case_info
+
+    def failing_update_from_case_info(case_info):
+        if case_info['id'] == 1234:
+            raise DatabaseError('Malformed case')
+        return update_from_case_info(case_info)
+
+    with mock.patch.object(Case.objects, 'update_from_case_info', side_effect=failing_update_from_case_info):
+        assert Case.objects.update_from_fogbugz_cases(cases) == 1
+    assert list(Case.objects.values_list('id', flat=True)) == [1235]
+
+
+@pytest.mark.django_db
+def test_migration_sort(migration_factory, ci_project):
+    """Test migrations are sorted in a topological order with the parents included."""
+    grand_parent = migration_factory(case__ci_project=ci_project, uid='c')
+    parent = migration_factory(case__ci_project=ci_project, uid='b', parent=grand_parent)
+    child = migration_factory(case__ci_project=ci_project, uid='a', parent=parent)
+    assert Migration.objects.sort(Migration.objects.filter(id__in=[child.id, grand_parent.id])) == [
+        grand_parent, parent, child]
+    # the cached ordering is invalidated on the migration change
+    grand_parent.parent = child
+    grand_parent.save()
+    with pytest.raises(MigrationSortError) as excinfo:
+        Migration.objects.sort(Migration.objects.filter(id=child.id))
+    assert set(excinfo.value.errors) == {child.uid, parent.uid}
+    # migrations which do not depend on the cycle are still sorted
+    other = migration_factory(case__ci_project=ci_project)
+    assert Migration.objects.sort(Migration.objects.filter(id=other.id)) == [other]
+
+
+@pytest.mark.django_db
+def test_migration_sort_parent_outside_ci_project(migration_factory, ci_project):
+    """Test only the migrations depending on the parent from another CI project can not be sorted."""
+    foreign_parent = migration_factory()
+    broken = migration_factory(case__ci_project=ci_project, parent=foreign_parent)
+    child = migration_factory(case__ci_project=ci_project, parent=broken)
+    other = migration_factory(case__ci_project=ci_project)
+    with pytest.raises(MigrationSortError) as excinfo:
+        Migration.objects.sort_uids(Migration.objects.filter(id=child.id))
+    assert set(excinfo.value.errors) == {child.uid, broken.uid}
+    assert foreign_parent.uid in str(excinfo.value)
+    assert Migration.objects.sort_uids(Migration.objects.filter(case__ci_project=ci_project).exclude(
+        id__in=[broken.id, child.id])) == [other.uid]
+
+
+@pytest.mark.django_db
+def test_migration_closure_cycle(migration_factory, ci_project):
+    """Test the migration closure is kept when the migration is made dependent on its descendant."""
+    parent = migration_factory(case__ci_project=ci_project)
+    child = migration_factory(case__ci_project=ci_project, parent=parent)
+    ancestors = set(MigrationClosure.objects.filter(descendant=parent).values_list('ancestor', 'depth'))
+    parent.parent = child
+    parent.save()
+    assert set(MigrationClosure.objects.filter(descendant=parent).values_list('ancestor', 'depth')) == ancestors
+    assert set(MigrationClosure.objects.filter(descendant=child).values_list('ancestor', 'depth')) == {
+        (child.id, 0), (parent.id, 1)}
+
+
+@pytest.mark.django_db
+def test_migration_steps(migration_factory):
+    """Test migration steps of all the phases are read with one query."""
+    migration = migration_factory()
+    final_step = FinalMigrationStep.objects.create(migration=migration, type='mysql', code='select 1', position=0)
+    assert final_step.phase == MigrationStep.PHASE_FINAL
+    assert list(FinalMigrationStep.objects.filter(migration=migration)) == [final_step]
+    assert list(migration.final_steps) == [final_step]
+    migration = Migration.objects.prefetch_related('steps').get(id=migration.id)
+    with CaptureQueriesContext(connection) as context:
+        phases = [migration.pre_deploy_steps, migration.post_deploy_steps, migration.final_steps]
+    assert not context.captured_queries
+    assert [[step.phase for step in steps] for steps in phases] == [
+        [MigrationStep.PHASE_PRE_DEPLOY], [MigrationStep.PHASE_POST_DEPLOY], [MigrationStep.PHASE_FINAL]]
+    assert list(migration.get_steps()) == [step for steps in phases for step in steps]
+
+
 @pytest.mark.django_db
 def test_migration_report_unicode(migration_report_factory):
     """Test migration report unicode."""
@@ -41,6 +151,37 @@ def test_migration_step_report_unicode(migration_report_factory):
         self=migration_step_report, status=migration_step_report.get_status_display())
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize('store_log', [True, False])
+def test_migration_report_get_log(migration_report_factory, settings, store_log):
+    """Test migration report log is assembled from the step reports."""
+    settings.MIGRATION_REPORT_STORE_LOG = store_log
+    migration_report = migration_report_factory()
+    step_report = migration_report.step_reports.select_related('step').get()
+    migration_report.calculate()
+    migration_report.refresh_from_db()
+    assert bool(migration_report.log) == store_log
+    assert step_report.log in migration_report.get_log()
+    assert 'position={0}'.format(step_report.step.position) in migration_report.get_log()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(['log', 'compressed'], [
+    ('short log', False),
+    ('long log\n' * 1000, True),
+    (COMPRESSED_PREFIX + 'short log', True),
+])
+def test_compressed_log(deployment_report, log, compressed):
+    """Test report log is stored compressed and read back transparently."""
+    deployment_report.log = log
+    deployment_report.save()
+    cursor = connection.cursor()
+    cursor.execute('SELECT log FROM core_deploymentreport WHERE id = %s', [deployment_report.id])
+    stored, = cursor.fetchone()
+    assert stored.startswith(COMPRESSED_PREFIX) == compressed
+    assert DeploymentReport.objects.get(id=deployment_report.id).log == log
+
+
 @pytest.mark.django_db
 def test_deployment_report_unicode(deployment_report):
     """Test deployment report unicode."""
@@ -48,6 +189,28 @@ def test_deployment_report_unicode(deployment_report):
         self=deployment_report, status=deployment_report.get_status_display())
 
 
+@pytest.mark.django_db
+def test_case_deployment(deployment_report_factory, case_factory, instance):
+    """Test the last deployed report of the case is maintained on the deployment report changes."""
+    case, other_case = case_factory(), case_factory()
+    first = deployment_report_factory(instance=instance, cases=[case, other_case])
+    deployment_report_factory(instance=instance, status=DeploymentReport.STATUS_ERROR, cases=[case])
+
+    def get_deployments():
+        return dict(CaseDeployment.objects.filter(instance=instance).values_list('case', 'report'))
+
+    assert get_deployments() == {case.id: first.id, other_case.id: first.id}
+    last = deployment_report_factory(instance=instance, cases=[case])
+    assert get_deployments() == {case.id: last.id, other_case.id: first.id}
+    first.cases.remove(other_case)
+    assert get_deployments() == {case.id: last.id}
+    last.status = DeploymentReport.STATUS_ERROR
+    last.save()
+    assert get_deployments() == {case.id: first.id}
+    first.delete()
+    assert get_deployments() == {}
+
+
 @pytest.mark.django_db
 @mock.patch('post_office.mail.send')
 def test_deloyment_report_email(mocked_send, deployment_report_factory, case):
@@ -58,3 +221,89 @@ def test_deloyment_report_email(mocked_send, deployment_report_factory, case):
         template=notification_template.template.name,
         sender=notification_template.from_email, context={'deployment_report': report},
         recipients=notification_template.to)
+
+
+@pytest.mark.django_db
+def test_update_to_fogbugz_merges_edits(mocked_fogbugz, migration_factory, settings):
+    """Test that all pending case edits are pushed with a single Fogbugz edit."""
+    migration = migration_factory()
+    case = migration.case
+    mocked_case = mocked_fogbugz.return_value.search.return_value.cases.find.return_value
+    mocked_case.attrs = dict(ixbug=case.id)
+    mocked_case.sfixfor.string = str(case.release.number)
+    mocked_case.dtfixfor.string = None
+    mocked_case.dtlastupdated.string = None
+    mocked_case.cixproject.string = case.ci_project.name
+    mocked_case.revision.string = case.revision
+    mocked_case.tags.findAll.return_value = [mock.Mock(string='some-tag')]
+    mocked_edited_case = mocked_fogbugz.return_value.edit.return_value.case
+    mocked_edited_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_edited_case.ixbugeventlatest.string = '12'
+    migration.reviewed = True
+    migration.save()
+    assert case.edits.count() >= 2
+    assert {CaseEdit.TYPE_MIGRATION_URL, CaseEdit.TYPE_MIGRATION_REVIEWED}.issubset(
+        case.edits.values_list('type', flat=True))
+    Case.objects.update_to_fogbugz(case.id)
+    mocked_fogbugz.return_value.edit.assert_called_once_with(
+        ixbug=case.id, sEvent='Migration was marked as reviewed', sTags='migration-reviewed,some-tag',
+        cols=Case.objects.edit_columns, **{settings.FOGBUGZ_MIGRATION_URL_FIELD_ID: mock.ANY})
+    assert not case.edits.count()
+    case.refresh_from_db()
+    assert case.latest_event_id == 12
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('case__latest_event_id', [11])
+def test_update_to_fogbugz_local_case_info(mocked_fogbugz, case):
+    """Test that the case edits are pushed without re-reading the case from Fogbugz."""
+    case.tags.set('some-tag')
+    CaseEdit.objects.create(case=case, type=CaseEdit.TYPE_MIGRATION_REVIEWED)
+    mocked_edited_case = mocked_fogbugz.return_value.edit.return_value.case
+    mocked_edited_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_edited_case.ixbugeventlatest.string = '12'
+    mocked_edited_case.tags.findAll.return_value = [
+        mock.Mock(string='some-tag'), mock.Mock(string='migration-reviewed')]
+    Case.objects.update_to_fogbugz(case.id)
+    assert not mocked_fogbugz.return_value.search.called
+    mocked_fogbugz.return_value.edit.assert_called_once_with(
+        ixbug=case.id, ixBugEventLatest=11, cols=Case.objects.edit_columns,
+        sEvent='Migration was marked as reviewed', sTags='migration-reviewed,some-tag')
+    case.refresh_from_db()
+    assert case.latest_event_id == 12
+    assert set(case.tags.names()) == {'some-tag', 'migration-reviewed'}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('case__latest_event_id', [11])
+def test_update_to_fogbugz_local_case_info_changed(mocked_fogbugz, case):
+    """Test that the case is re-read from Fogbugz when it was changed since the last sync."""
+    CaseEdit.objects.create(case=case, type=CaseEdit.TYPE_MIGRATION_REVIEWED)
+    mocked_case = mocked_fogbugz.return_value.search.return_value.cases.find.return_value
+    mocked_case.attrs = dict(ixbug=case.id)
+    mocked_case.sfixfor.string = str(case.release.number)
+    mocked_case.dtfixfor.string = None
+    mocked_case.dtlastupdated.string = None
+    mocked_case.cixproject.string = case.ci_project.name
+    mocked_case.revision.string = case.revision
+    mocked_edited_case = mock.MagicMock()
+    mocked_edited_case.case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_edited_case.case.ixbugeventlatest.string = '13'
+    mocked_fogbugz.return_value.edit.side_effect = [
+        fogbugz.FogBugzAPIError('Error Code 9: Case has changed'), mocked_edited_case]
+    Case.objects.update_to_fogbugz(case.id)
+    assert mocked_fogbugz.return_value.search.call_count == 1
+    assert mocked_fogbugz.return_value.edit.call_count == 2
+    assert not case.edits.count()
+
+
+@pytest.mark.django_db
+def test_touch_model_versions_after_commit(case_factory):
+    """Test data versions changed in the transaction are changed again after the request."""
+    case_factory()
+    version, = get_model_versions(Case)
+    request_finished.send(sender=None)
+    changed, = get_model_versions(Case)
+    assert changed > version
+    request_finished.send(sender=None)
+    assert get_model_versions(Case) == [changed]
@@ -0,0 +1,38 @@
+"""Tests for management commands."""
+import pytest
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils.six import StringIO
+
+from pdt.api.caching import response_cache
+from pdt.core.fields import COMPRESSED_PREFIX
+from pdt.core.models import DeploymentReport
+
+
+@pytest.mark.django_db
+def test_compress_logs(deployment_report):
+    """Test compress the report logs stored uncompressed."""
+    log = 'long log\n' * 1000
+    cursor = connection.cursor()
+    cursor.execute('UPDATE core_deploymentreport SET log = %s WHERE id = %s', [log, deployment_report.id])
+    stdout = StringIO()
+    call_command('compress_logs', stdout=stdout)
+    cursor.execute('SELECT log FROM core_deploymentreport WHERE id = %s', [deployment_report.id])
+    stored, = cursor.fetchone()
+    assert stored.startswith(COMPRESSED_PREFIX)
+    assert DeploymentReport.objects.get(id=deployment_report.id).log == log
+    assert 'Deployment reports: 1 logs, {0} bytes stored as {1} bytes'.format(len(log), len(stored)) in \
+        stdout.getvalue()
+
+
+def test_api_cache_stats():
+    """Test report and reset the API response cache hit ratio."""
+    response_cache.count('cases', 'hits')
+    response_cache.count('cases', 'hits')
+    response_cache.count('cases', 'misses')
+    stdout = StringIO()
+    call_command('api_cache_stats', reset=True, stdout=stdout)
+    assert 'cases: 2 hits, 1 misses, 66.7% hit ratio' in stdout.getvalue()
+    assert 'migrations: 0 hits, 0 misses, 0.0% hit ratio' in stdout.getvalue()
+    assert response_cache.stats(['cases']) == {'cases': dict(hits=0, misses=0, ratio=0)}
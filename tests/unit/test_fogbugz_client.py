@@ -0,0 +1,88 @@
+"""Test pooled Fogbugz API client."""
+import http.client
+import urllib.error
+import urllib.request
+
+import fogbugz
+import mock
+import pytest
+
+from pdt.core.fogbugz_client import (
+    CircuitOpenError,
+    FogBugzPool,
+    KeepAliveHandler,
+)
+
+
+@pytest.fixture
+def pool(mocked_fogbugz):
+    """Fogbugz client pool."""
+    return FogBugzPool(size=2, retries=2, backoff=0.1, failure_threshold=2, reset_timeout=60)
+
+
+def test_pool_reuses_client(pool, mocked_fogbugz):
+    """Test that the client is created once and then reused."""
+    with pool.client() as fb:
+        fb.search(q=1)
+    with pool.client() as fb:
+        fb.search(q=2)
+    assert mocked_fogbugz.call_count == 1
+    assert mocked_fogbugz.return_value.search.call_count == 2
+    stats = pool.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['calls'] == 3
+
+
+@mock.patch('time.sleep')
+def test_pool_retries_with_backoff(mocked_sleep, pool, mocked_fogbugz):
+    """Test that the throttled call is retried with exponential backoff."""
+    error = fogbugz.FogBugzConnectionError(urllib.error.HTTPError('url', 503, 'Throttled', {}, None))
+    mocked_fogbugz.return_value.search.side_effect = [error, error, 'result']
+    with pool.client() as fb:
+        assert fb.search(q=1) == 'result'
+    assert mocked_sleep.call_args_list == [mock.call(0.1), mock.call(0.2)]
+    assert pool.stats()['retries'] == 2
+
+
+@mock.patch('time.sleep')
+def test_pool_circuit_breaker(mocked_sleep, pool, mocked_fogbugz):
+    """Test that the calls are suspended after consecutive failures."""
+    mocked_fogbugz.side_effect = fogbugz.FogBugzConnectionError('Connection refused')
+    for _ in range(2):
+        with pytest.raises(fogbugz.FogBugzConnectionError):
+            with pool.client() as fb:
+                fb.search(q=1)
+    assert mocked_fogbugz.call_count == 6
+    with pytest.raises(CircuitOpenError):
+        with pool.client() as fb:
+            fb.search(q=1)
+    assert mocked_fogbugz.call_count == 6
+
+
+@mock.patch('time.sleep')
+def test_pool_does_not_retry_edit(mocked_sleep, pool, mocked_fogbugz):
+    """Test that the not idempotent call is not retried."""
+    mocked_fogbugz.return_value.edit.side_effect = fogbugz.FogBugzConnectionError('Timed out')
+    with pytest.raises(fogbugz.FogBugzConnectionError):
+        with pool.client() as fb:
+            fb.edit(ixBug=1)
+    assert mocked_fogbugz.return_value.edit.call_count == 1
+    assert not mocked_sleep.called
+
+
+def test_keep_alive_handler_resend():
+    """Test that the request is only resent if it could not be sent over the reused connection."""
+    handler = KeepAliveHandler()
+    request = urllib.request.Request('http://fogbugz/api.asp')
+    connection_class = mock.Mock()
+    dropped = handler.connections[connection_class, 'fogbugz'] = mock.Mock(**{'request.side_effect': BrokenPipeError})
+    assert handler.keep_alive_open(connection_class, request).url == 'http://fogbugz/api.asp'
+    assert dropped.close.called
+    connection = connection_class.return_value
+    connection.getresponse.side_effect = http.client.BadStatusLine('')
+    with pytest.raises(urllib.error.URLError):
+        handler.keep_alive_open(connection_class, request)
+    # the request could have been processed by the server
+    assert connection.request.call_count == 2
+    assert not handler.connections
@@ -1,8 +1,16 @@
 """Test PDT tasks."""
+import fogbugz
 import mock
 import pytest
 
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils.dateparse import parse_datetime
+
 from pdt.core.tasks import (
+    attach_deployment_report_cases,
+    calculate_migration_report,
+    calculate_migration_reports,
     fetch_cases,
     send_emails,
     update_case_from_fogbugz,
@@ -11,6 +19,7 @@ from pdt.core.tasks import (
     update_cases_to_fogbugz,
 )
 from pdt.core.models import (
+    CaseEdit,
     DeploymentReport,
     MigrationReport,
 )
@@ -32,6 +41,9 @@ def test_update_case_to_fogbugz(
     mocked_case.cixproject.string = 'some-ci-project'
     mocked_case.sproject.string = 'Some project'
     mocked_case.sarea.string = 'Some area'
+    mocked_edited_case = mocked_fogbugz.return_value.edit.return_value.case
+    mocked_edited_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_edited_case.ixbugeventlatest.string = '12'
     deployment_report_factory(
         status=DeploymentReport.STATUS_DEPLOYED,
         instance=instance)
@@ -48,11 +60,43 @@ def test_update_case_to_fogbugz(
     assert len(edits) == 0
 
 
-@mock.patch('pdt.core.tasks.update_case_to_fogbugz')
-def test_update_cases_to_fogbugz(mocked_update, transactional_db, case):
-    """Test update cases to fogbugz task."""
+@mock.patch('pdt.core.models.CaseManager.update_to_fogbugz')
+def test_update_cases_to_fogbugz(mocked_update, transactional_db, case_factory):
+    """Test update cases to fogbugz task only pushes the cases with pending edits."""
+    case = case_factory()
+    case_factory()
+    CaseEdit.objects.create(case=case, type=CaseEdit.TYPE_MIGRATION_URL)
+    update_cases_to_fogbugz()
+    mocked_update.assert_called_once_with(case.id)
+
+
+@mock.patch('pdt.core.models.CaseManager.update_to_fogbugz')
+def test_update_cases_to_fogbugz_errors(mocked_update, transactional_db, case_factory):
+    """Test update cases to fogbugz task pushes the rest of the cases when one of them fails."""
+    cases = [case_factory(), case_factory(), case_factory()]
+    for case in cases:
+        CaseEdit.objects.create(case=case, type=CaseEdit.TYPE_MIGRATION_URL)
+    mocked_update.side_effect = [TypeError('Some bug'), fogbugz.FogBugzAPIError('Some error'), None]
+    update_cases_to_fogbugz()
+    assert mocked_update.call_args_list == [mock.call(case.id) for case in cases]
+
+
+@pytest.mark.parametrize('case__latest_event_id', [11])
+def test_update_case_to_fogbugz_deleted_report(mocked_fogbugz, transactional_db, deployment_report_factory, case):
+    """Test the case edit about the deleted report is dropped."""
+    report = deployment_report_factory(cases=[case])
+    CaseEdit.objects.filter(case=case).delete()
+    CaseEdit.objects.create(case=case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT, params=dict(report=report.id))
+    report.delete()
     update_cases_to_fogbugz()
-    mocked_update.apply_async.assert_called_once_with(kwargs=dict(case_id=case.id))
+    assert not mocked_fogbugz.return_value.edit.called
+    assert not case.edits.exists()
+
+
+def test_update_case_to_fogbugz_no_edits(mocked_fogbugz, transactional_db, case):
+    """Test update case to fogbugz task doesn't call fogbugz when there's nothing to push."""
+    update_case_to_fogbugz(case.id)
+    assert not mocked_fogbugz.called
 
 
 def test_update_case_from_fogbugz(
@@ -75,18 +119,32 @@ def test_update_case_from_fogbugz(
     assert case.revision == '123123'
 
 
-@mock.patch('pdt.core.tasks.update_case_from_fogbugz')
 @pytest.mark.parametrize('case__release', [None])
-def test_update_cases_from_fogbugz(mocked_update, transactional_db, case):
+def test_update_cases_from_fogbugz(mocked_fogbugz, transactional_db, case):
     """Test update cases from fogbugz task."""
+    mocked_case = mock.MagicMock()
+    mocked_fogbugz.return_value.search.return_value.findAll.return_value = [mocked_case]
+    mocked_case.attrs = dict(ixbug=case.id)
+    mocked_case.sfixfor.string = '1516'
+    mocked_case.dtfixfor.string = '2015-01-18T23:00:00Z'
+    mocked_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_case.stitle.string = 'Some title'
+    mocked_case.soriginaltitle.string = 'Some original title'
+    mocked_case.cixproject.string = 'some-ci-project'
+    mocked_case.sproject.string = 'Some project'
+    mocked_case.sarea.string = 'Some area'
+    mocked_case.revision.string = '123123'
     update_cases_from_fogbugz()
-    mocked_update.apply_async.assert_called_once_with(kwargs=dict(case_id=case.id))
+    mocked_fogbugz.return_value.search.assert_called_once_with(q=str(case.id), cols=mock.ANY)
+    case.refresh_from_db()
+    assert case.title == 'Some title'
+    assert case.release.number == 1516
 
 
 @mock.patch('pdt.core.tasks.update_case_from_fogbugz')
 def test_fetch_cases(mocked_update, mocked_fogbugz, transactional_db, case):
     """Test fetch cases from fogbugz task."""
-    mocked_case = mock.Mock()
+    mocked_case = mock.MagicMock()
     mocked_fogbugz.return_value.search.return_value.findAll.return_value = [mocked_case]
     mocked_case.attrs = dict(ixbug=case.id)
     mocked_case.sfixfor.string = '1516'
@@ -97,8 +155,113 @@ def test_fetch_cases(mocked_update, mocked_fogbugz, transactional_db, case):
     mocked_case.cixproject.string = 'some-ci-project'
     mocked_case.sproject.string = 'Some project'
     mocked_case.sarea.string = 'Some area'
+    mocked_case.revision.string = '123123'
+    mocked_case.tags.findAll.return_value = [mock.Mock(string='some-tag')]
+    fetch_cases()
+    assert not mocked_update.apply_async.called
+    assert mocked_fogbugz.return_value.search.call_count == 1
+    case.refresh_from_db()
+    assert case.title == 'Some title'
+    assert case.revision == '123123'
+    assert case.ci_project.name == 'some-ci-project'
+    assert set(case.tags.names()) == {'some-tag'}
+    case.ci_project.refresh_from_db()
+    assert case.ci_project.synced_date
+
+
+def test_fetch_cases_delta(mocked_fogbugz, transactional_db, case_factory, case):
+    """Test fetch cases from fogbugz task only fetches and updates the changed cases of each CI project."""
+    mocked_case = mock.MagicMock()
+    mocked_fogbugz.return_value.search.return_value.findAll.return_value = [mocked_case]
+    mocked_case.attrs = dict(ixbug=case.id)
+    mocked_case.sfixfor.string = str(case.release.number)
+    mocked_case.dtfixfor.string = None
+    mocked_case.dtlastupdated.string = '2015-01-18T23:00:00Z'
+    mocked_case.stitle.string = 'Some title'
+    mocked_case.cixproject.string = case.ci_project.name
+    mocked_case.revision.string = case.revision
+    case.modified_date = parse_datetime('2015-01-18T23:00:00Z')
+    case.save()
     fetch_cases()
-    mocked_update.apply_async.assert_called_once_with(kwargs=dict(case_id=case.id))
+    assert 'edited:' not in mocked_fogbugz.return_value.search.call_args[1]['q']
+    case.refresh_from_db()
+    assert case.title != 'Some title'
+    case.ci_project.refresh_from_db()
+    synced_date = case.ci_project.synced_date
+    # the new CI project is fetched fully, the synced one since its own last sync
+    new_ci_project = case_factory().ci_project
+    mocked_fogbugz.return_value.search.reset_mock()
+    fetch_cases()
+    ci_project_query, rest_query = [call[1]['q'] for call in mocked_fogbugz.return_value.search.call_args_list]
+    assert 'edited:' in ci_project_query
+    assert '"{0}"'.format(case.ci_project.name) in ci_project_query
+    assert 'edited:' not in rest_query
+    assert '-{0}:"{1}"'.format(settings.FOGBUGZ_CI_PROJECT_FIELD_ID, case.ci_project.name) in rest_query
+    new_ci_project.refresh_from_db()
+    case.ci_project.refresh_from_db()
+    assert new_ci_project.synced_date
+    assert case.ci_project.synced_date > synced_date
+    fetch_cases(full=True)
+    assert 'edited:' not in mocked_fogbugz.return_value.search.call_args[1]['q']
+
+
+@mock.patch('pdt.core.tasks.calculate_migration_report')
+def test_migration_step_report_changes(mocked_calculate, transactional_db, migration_report_factory):
+    """Test that the migration report calculation is scheduled instead of done on every step report change."""
+    report = migration_report_factory(status=MigrationReport.STATUS_ERROR)
+    step_report = report.step_reports.first()
+    step_report.save()
+    step_report.save()
+    report.refresh_from_db()
+    assert report.status == MigrationReport.STATUS_ERROR
+    assert not report.is_calculated
+    assert mocked_calculate.apply_async.call_args == mock.call(kwargs=dict(report_id=report.id), countdown=mock.ANY)
+
+
+def test_attach_deployment_report_cases(
+        mocked_fogbugz, transactional_db, deployment_report_factory, case_factory, case):
+    """Test attach deployment report cases task notifies only the attached cases."""
+    report = deployment_report_factory()
+    notified_case = case_factory()
+    report.cases.add(notified_case)
+    attach_deployment_report_cases(report.id, [case.id])
+    assert set(report.cases.all()) == {case, notified_case}
+    assert not mocked_fogbugz.return_value.search.called
+    assert CaseEdit.objects.filter(case=case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT).exists()
+    assert not CaseEdit.objects.filter(case=notified_case, type=CaseEdit.TYPE_DEPLOYMENT_REPORT).exists()
+
+
+@mock.patch('pdt.core.tasks.calculate_migration_report.apply_async')
+def test_calculate_migration_report(mocked_apply_async, transactional_db, migration_report_factory):
+    """Test calculate migration report task."""
+    report = migration_report_factory(status=MigrationReport.STATUS_APPLIED)
+    calculate_migration_report(report.id)
+    report.refresh_from_db()
+    assert report.is_calculated
+    # only one of the migration steps is applied
+    assert report.status == MigrationReport.STATUS_ERROR
+    assert 'Applying migration step' in report.log
+
+
+@mock.patch('pdt.core.tasks.calculate_migration_report.apply_async')
+def test_calculate_migration_report_error(mocked_apply_async, transactional_db, migration_report_factory):
+    """Test the migration report is left not calculated if the calculation fails."""
+    report = migration_report_factory(status=MigrationReport.STATUS_APPLIED)
+    with mock.patch.object(MigrationReport, 'calculate', side_effect=DatabaseError):
+        with pytest.raises(DatabaseError):
+            calculate_migration_report(report.id)
+    report.refresh_from_db()
+    assert not report.is_calculated
+
+
+@mock.patch('pdt.core.tasks.calculate_migration_report')
+def test_calculate_migration_reports(mocked_calculate, transactional_db, migration_report_factory):
+    """Test calculate migration reports task only calculates the changed reports."""
+    report = migration_report_factory()
+    other_report = migration_report_factory()
+    MigrationReport.objects.filter(id=other_report.id).update(is_calculated=True)
+    calculate_migration_reports()
+    mocked_calculate.assert_called_once_with(report.id)
 
 
 @mock.patch('pdt.core.tasks.call_command')